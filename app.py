@@ -1,18 +1,39 @@
 """
-Tamasha Free Channel HLS Stream Extractor — v2.4
+Tamasha Free Channel HLS Stream Extractor — v2.5
 =================================================
-Fixed: Lock-free design using a simple busy flag instead of threading.Lock.
-This prevents stuck-lock issues when gunicorn recycles workers.
+Extractions run on a pool of warm browsers (EXTRACT_CONCURRENCY per worker)
+fed from a bounded queue, replacing the old one-at-a-time busy flag. Each
+browser lives in its own subprocess, killed outright if a job overruns
+EXTRACT_DEADLINE_SECONDS.
 """
 
 import os
 import re
 import sys
 import time
+import math
+import queue
+import signal
+import json
+import gzip
+import base64
+import hashlib
+import sqlite3
+import atexit
 import logging
+import tempfile
+import threading
+import itertools
+import multiprocessing
+from uuid import uuid4
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
-from urllib.parse import urlparse, parse_qs
-from flask import Flask, jsonify, request
+from urllib.parse import urlparse, parse_qs, unquote
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, jsonify, request, stream_with_context
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
 
 app = Flask(__name__)
@@ -26,6 +47,52 @@ TAMASHA = os.environ.get("TAMASHA_BASE_URL", "https://tamashaweb.com")
 EXTRA_WAIT = int(os.environ.get("EXTRA_WAIT_SECONDS", "10"))
 NAV_TIMEOUT = int(os.environ.get("NAV_TIMEOUT_MS", "35000"))
 CACHE_TTL = int(os.environ.get("CACHE_TTL_SECONDS", "300"))
+CACHE_DB = os.environ.get("CACHE_DB") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "tamasha-cache.db")
+CACHE_MAX_TTL = int(os.environ.get("CACHE_MAX_TTL_SECONDS", "3600"))
+EXPIRY_MARGIN = int(os.environ.get("TOKEN_EXPIRY_MARGIN_SECONDS", "60"))
+# Serve-stale window past expiry; 0 disables. exp is already EXPIRY_MARGIN before the
+# token dies, so cap it to leave a stale URL at least 30s of token life
+STALE_MAX = max(0, min(int(os.environ.get("STALE_MAX_SECONDS", "20")), EXPIRY_MARGIN - 30))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "500"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+CACHE_SWEEP_INTERVAL = int(os.environ.get("CACHE_SWEEP_INTERVAL_SECONDS", "60"))
+CACHE_SNAPSHOT = os.environ.get("CACHE_SNAPSHOT",   # "" disables; point at a volume to survive redeploys
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache-snapshot.json"))
+CACHE_SNAPSHOT_INTERVAL = int(os.environ.get("CACHE_SNAPSHOT_INTERVAL_SECONDS", "30"))
+BREAKER_MAX_COOLDOWN = int(os.environ.get("BREAKER_MAX_COOLDOWN_SECONDS", "3600"))
+REFRESH_AHEAD = int(os.environ.get("REFRESH_AHEAD_SECONDS", "120"))   # 0 disables the scheduler
+REFRESH_BUDGET = float(os.environ.get("REFRESH_BUDGET_SECONDS_PER_MIN", "60"))
+REFRESH_MIN_POPULARITY = float(os.environ.get("REFRESH_MIN_POPULARITY", "1"))
+POPULARITY_HALF_LIFE = int(os.environ.get("POPULARITY_HALF_LIFE_SECONDS", "3600"))
+HLS_SCORE_THRESHOLD = int(os.environ.get("HLS_SCORE_THRESHOLD", "240"))   # ≈ any wmsauthsign-signed m3u8
+HLS_GRACE = float(os.environ.get("HLS_GRACE_SECONDS", "1.5"))
+FAST_PATH = os.environ.get("FAST_PATH", "1") == "1"
+FAST_PATH_TIMEOUT = float(os.environ.get("FAST_PATH_TIMEOUT_SECONDS", "5"))
+FAST_PATH_VERIFY = os.environ.get("FAST_PATH_VERIFY", "1") == "1"
+TOKEN_REPLAY = os.environ.get("TOKEN_REPLAY", "1") == "1"
+REPLAY_MAX_FAILS = int(os.environ.get("REPLAY_MAX_FAILS", "2"))
+BUILD_ID_TTL = int(os.environ.get("BUILD_ID_TTL_SECONDS", "3600"))
+NAV_SIGNAL_TIMEOUT = float(os.environ.get("NAV_SIGNAL_TIMEOUT_SECONDS", "12"))
+CDP_BLOCKING = os.environ.get("CDP_BLOCKING", "1") == "1"   # 0 = block through the Python route handler
+EXTRACT_TIMEOUT = int(os.environ.get("EXTRACT_TIMEOUT_SECONDS", "100"))
+EXTRACT_DEADLINE = int(os.environ.get("EXTRACT_DEADLINE_SECONDS", "90"))   # hard kill, per job
+TRACE_BUFFER = int(os.environ.get("TRACE_BUFFER", "50"))          # recent traces kept for /api/traces
+BATCH_DEADLINE = int(os.environ.get("BATCH_DEADLINE_SECONDS", "90"))
+BATCH_MAX_PENDING = int(os.environ.get("BATCH_MAX_PENDING", "64"))   # queued+running batch tasks
+COALESCE_WAIT = int(os.environ.get("COALESCE_WAIT_SECONDS", str(EXTRACT_TIMEOUT)))
+EXTRACT_CONCURRENCY = max(1, int(os.environ.get("EXTRACT_CONCURRENCY", "2")))
+# Browsers refresh-ahead and stale revalidation may hold between them; always below the
+# pool size so clients keep one (so 0, i.e. no background extraction, at concurrency 1)
+BACKGROUND_CONCURRENCY = max(0, min(EXTRACT_CONCURRENCY - 1,
+                                    int(os.environ.get("BACKGROUND_CONCURRENCY", str(EXTRACT_CONCURRENCY - 1)))))
+EXTRACT_QUEUE_DEPTH = int(os.environ.get("EXTRACT_QUEUE_DEPTH", "16"))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "32"))
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION_SECONDS", "600"))
+BROWSER_PREWARM = os.environ.get("BROWSER_PREWARM", "0") == "1"   # else spawn on first extraction
+BROWSER_MAX_USES = int(os.environ.get("BROWSER_MAX_USES", "50"))
+BROWSER_MAX_RSS_MB = int(os.environ.get("BROWSER_MAX_RSS_MB", "700"))
+BROWSER_HEALTH_INTERVAL = int(os.environ.get("BROWSER_HEALTH_INTERVAL_SECONDS", "30"))
 
 # ── Channels ──
 CH = {
@@ -57,39 +124,324 @@ CH = {
     "ary-musik-live":"ary-musik-live",
 }
 
-# ── Busy flag (not a Lock — resets naturally if worker dies) ──
-_busy = False
-_busy_since = None
+# ── Token expiry ──
+_EPOCH = datetime(1970, 1, 1)
+_EXP_KEYS = ("expires", "expiry", "exp", "e", "validto", "valid_until")
+_EXP_RE = re.compile(r'(?:^|[~&])exp=(\d{10})')
 
-def _is_busy():
-    global _busy, _busy_since
-    if not _busy:
-        return False
-    # Auto-reset if stuck for more than 90s (safety valve)
-    if _busy_since and (time.time() - _busy_since) > 90:
-        log.warning("⚠ Auto-resetting stuck busy flag (>90s)")
-        _busy = False
-        _busy_since = None
-        return False
-    return True
+_SKEW_SLACK = 300  # clock drift tolerated between the stream server and us
+
+def _wms_issued(issued, valid_s, now):
+    """
+    Epoch a wmsAuthSign token was issued, given its server_time read as UTC.
+    server_time may be local time (the site runs on Asia/Karachi), so a
+    whole-hour offset is dropped when the remainder reads as the age of a
+    live token; if several offsets do (tokens valid over an hour), the oldest
+    reading wins so a TTL is never overstated. A future server_time that no
+    offset explains as live is a dead token; anything else is trusted.
+    """
+    d = issued - now
+    oldest = -(valid_s + _SKEW_SLACK)
+    hours = math.ceil((d - _SKEW_SLACK) / 3600)   # remainder lands in (slack - 1h, slack]
+    if d - hours * 3600 < oldest:
+        return now + d - hours * 3600 if d > 0 and hours <= 14 else issued
+    while d - (hours + 1) * 3600 >= oldest: hours += 1
+    return issued - hours * 3600 if abs(hours) <= 14 else issued
+
+def _b64json(seg):
+    return json.loads(base64.urlsafe_b64decode(seg + "=" * (-len(seg) % 4)))
+
+def _token_expiry(url, now=None):
+    """
+    Best-effort expiry (epoch seconds) encoded in a signed playlist URL:
+    Nimble/Wowza wmsAuthSign (server_time + validminutes), expires=/exp=/e=
+    epochs, Akamai-style exp= tokens and JWT exp claims. None if unknown.
+    """
+    now = now or time.time()
+    q = {k.lower(): v[0] for k, v in parse_qs(urlparse(url).query).items()}
+    sign = q.get("wmsauthsign")
+    if sign:
+        try:
+            sign = unquote(sign).replace(" ", "+")  # parse_qs turns a raw base64 "+" into a space
+            f = parse_qs(base64.b64decode(sign + "=" * (-len(sign) % 4)).decode("latin-1"))
+            mins = int(f["validminutes"][0])
+            issued = (datetime.strptime(f["server_time"][0], "%m/%d/%Y %I:%M:%S %p") - _EPOCH).total_seconds()
+            return _wms_issued(issued, mins * 60, now) + mins * 60
+        except (KeyError, ValueError, TypeError): pass
+    for k in _EXP_KEYS:
+        v = q.get(k, "")
+        if v.isdigit() and len(v) in (10, 13): return int(v) / (1000 if len(v) == 13 else 1)
+    for k in ("token", "hdnts", "__token__", "jwt"):
+        v = q.get(k)
+        if not v: continue
+        m = _EXP_RE.search(v)
+        if m: return int(m.group(1))
+        if v.count(".") == 2:
+            try: return float(_b64json(v.split(".")[1])["exp"])
+            except (KeyError, ValueError, TypeError): pass
+    return None
 
-def _set_busy(val):
-    global _busy, _busy_since
-    _busy = val
-    _busy_since = time.time() if val else None
+def _ttl_for(url, now=None):
+    """Seconds to cache url: token expiry minus EXPIRY_MARGIN, else CACHE_TTL."""
+    now = now or time.time()
+    exp = _token_expiry(url, now)
+    if exp is None: return CACHE_TTL
+    return max(0, min(CACHE_MAX_TTL, exp - now - EXPIRY_MARGIN))
 
 # ── Cache ──
-_cache = {}
+def _dt(epoch): return _EPOCH + timedelta(seconds=epoch)
+def _epoch(dt): return (dt - _EPOCH).total_seconds()
 
-def cget(ch):
+class _SharedCache:
+    """
+    Channel → stream entries in a SQLite WAL database shared by every
+    gunicorn worker on the node (tmpfs by default, so reads never touch
+    disk). One connection per thread; each statement is its own atomic
+    transaction. Also holds short extraction leases so two workers don't
+    launch browsers for the same channel at once.
+
+    Bounded by CACHE_MAX_ENTRIES and CACHE_MAX_BYTES with LRU eviction
+    (atime is refreshed at most every ATIME_SLACK seconds to keep hits
+    read-only); expired rows are swept by a background thread. Counters
+    are per process.
+    """
+    VERSION = 2
+    ATIME_SLACK = 30
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS cache (ch TEXT PRIMARY KEY, url TEXT NOT NULL,"
+        " alts TEXT NOT NULL, ts REAL NOT NULL, exp REAL NOT NULL,"
+        " size INTEGER NOT NULL DEFAULT 0, atime REAL NOT NULL DEFAULT 0)",
+        "CREATE INDEX IF NOT EXISTS cache_atime ON cache(atime)",
+        "CREATE TABLE IF NOT EXISTS lease (ch TEXT PRIMARY KEY, owner TEXT NOT NULL, until REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS job (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)",
+    )
+    COUNTERS = ("hits", "stale_hits", "misses", "sets", "evictions", "expired")
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.sweeper_pid = None
+
+    def count(self, name, n=1):
+        with self.lock: self.counters[name] += n
+
+    def _db(self):
+        db = getattr(self.local, "db", None)
+        if db is None or self.local.pid != os.getpid():
+            if self.path == ":memory:":  # single-process fallback, still shared across threads
+                db = sqlite3.connect("file:tamasha-cache?mode=memory&cache=shared", uri=True,
+                                     timeout=5, isolation_level=None)
+            else:
+                db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+            if db.execute("PRAGMA user_version").fetchone()[0] < self.VERSION:
+                db.execute("DROP TABLE IF EXISTS cache")  # it's only a cache
+                db.execute(f"PRAGMA user_version={self.VERSION}")
+            for stmt in self.SCHEMA: db.execute(stmt)
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    @staticmethod
+    def _entry(row):
+        return {"url": row[0], "alts": json.loads(row[1]), "ts": _dt(row[2]), "exp": _dt(row[3])}
+
+    def get(self, ch):
+        db = self._db()
+        row = db.execute("SELECT url, alts, ts, exp, atime FROM cache WHERE ch=?", (ch,)).fetchone()
+        if not row: return None
+        now = time.time()
+        if now - row[4] > self.ATIME_SLACK:
+            db.execute("UPDATE cache SET atime=? WHERE ch=?", (now, ch))
+        return self._entry(row)
+
+    def set(self, ch, e):
+        alts = json.dumps(e["alts"])
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO cache VALUES (?,?,?,?,?,?,?)",
+                   (ch, e["url"], alts, _epoch(e["ts"]), _epoch(e["exp"]),
+                    len(ch) + len(e["url"]) + len(alts), time.time()))
+        self.count("sets")
+        self._enforce(db)
+
+    def _enforce(self, db):
+        n, size = db.execute("SELECT count(*), coalesce(sum(size),0) FROM cache").fetchone()
+        if n <= CACHE_MAX_ENTRIES and size <= CACHE_MAX_BYTES: return
+        victims = []
+        for ch, sz in db.execute("SELECT ch, size FROM cache ORDER BY atime").fetchall():
+            if n <= CACHE_MAX_ENTRIES and size <= CACHE_MAX_BYTES: break
+            victims.append(ch); n -= 1; size -= sz
+        db.executemany("DELETE FROM cache WHERE ch=?", [(v,) for v in victims])
+        self.count("evictions", len(victims))
+        log.info(f"🧹 Evicted {len(victims)} LRU cache entr{'y' if len(victims)==1 else 'ies'}")
+
+    def sweep(self):
+        """Drop rows past the stale window and dead leases; returns rows removed."""
+        db = self._db()
+        now = time.time()
+        n = db.execute("DELETE FROM cache WHERE exp<?", (now - STALE_MAX,)).rowcount
+        db.execute("DELETE FROM lease WHERE until<?", (now,))
+        db.execute("DELETE FROM job WHERE updated<?", (now - JOB_RETENTION,))
+        if n: self.count("expired", n)
+        return n
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(CACHE_SWEEP_INTERVAL)
+            try: self.sweep()
+            except sqlite3.Error as e: log.warning(f"Cache sweep failed: {e}")
+
+    def start_sweeper(self):
+        if self.sweeper_pid == os.getpid(): return
+        self.sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_loop, name="cache-sweeper", daemon=True).start()
+
+    def stats(self):
+        n, size = self._db().execute("SELECT count(*), coalesce(sum(size),0) FROM cache").fetchone()
+        with self.lock: c = dict(self.counters)
+        looked = c["hits"] + c["stale_hits"] + c["misses"]
+        return {"entries": n, "bytes": size, "max_entries": CACHE_MAX_ENTRIES, "max_bytes": CACHE_MAX_BYTES,
+                **c, "hit_ratio": round((c["hits"] + c["stale_hits"]) / looked, 3) if looked else None}
+
+    def delete(self, ch, expired_before=None):
+        """Drop ch; with expired_before, only if its row is still that stale (a peer may have just set it)."""
+        if expired_before is None:
+            return self._db().execute("DELETE FROM cache WHERE ch=?", (ch,)).rowcount
+        return self._db().execute("DELETE FROM cache WHERE ch=? AND exp<?", (ch, expired_before)).rowcount
+
+    def clear(self):
+        return self._db().execute("DELETE FROM cache").rowcount
+
+    def items(self):
+        rows = self._db().execute("SELECT ch, url, alts, ts, exp FROM cache").fetchall()
+        return [(r[0], self._entry(r[1:])) for r in rows]
+
+    def __len__(self):
+        return self._db().execute("SELECT count(*) FROM cache").fetchone()[0]
+
+    def claim(self, ch, ttl):
+        """Take the extraction lease for ch unless a live one is held by another process."""
+        now = time.time()
+        try:
+            cur = self._db().execute(
+                "INSERT INTO lease VALUES (?,?,?) ON CONFLICT(ch) DO UPDATE"
+                " SET owner=excluded.owner, until=excluded.until WHERE lease.until<? OR lease.owner=excluded.owner",
+                (ch, str(os.getpid()), now + ttl, now))
+            return cur.rowcount == 1
+        except sqlite3.Error as e:
+            log.warning(f"Lease claim failed ({e}) — extracting anyway")
+            return True
+
+    def holder(self, ch):
+        row = self._db().execute("SELECT owner FROM lease WHERE ch=? AND until>=?", (ch, time.time())).fetchone()
+        return row[0] if row else None
+
+    def release(self, ch):
+        try: self._db().execute("DELETE FROM lease WHERE ch=? AND owner=?", (ch, str(os.getpid())))
+        except sqlite3.Error: pass
+
+    def job_put(self, view):
+        self._db().execute("INSERT OR REPLACE INTO job VALUES (?,?,?)",
+                           (view["id"], json.dumps(view), time.time()))
+
+    def job_get(self, jid):
+        row = self._db().execute("SELECT data FROM job WHERE id=?", (jid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+_cache = _SharedCache(CACHE_DB)
+
+def cget(ch, stale_ok=False):
+    """Fresh entry for ch; with stale_ok also one up to STALE_MAX seconds past expiry."""
     e = _cache.get(ch)
-    if not e: return None
-    if (datetime.utcnow() - e["ts"]).total_seconds() < CACHE_TTL: return e
-    _cache.pop(ch, None)
+    if not e:
+        _cache.count("misses"); return None
+    now = datetime.utcnow()
+    if now < e["exp"]:
+        _cache.count("hits"); return e
+    if (now - e["exp"]).total_seconds() < STALE_MAX:
+        _cache.count("stale_hits" if stale_ok else "misses")
+        return e if stale_ok else None
+    _cache.delete(ch, _epoch(now) - STALE_MAX)
+    _cache.count("expired"); _cache.count("misses")
     return None
 
+def centries():
+    """Snapshot of (channel, entry) pairs, expired ones included."""
+    return _cache.items()
+
 def cset(ch, url, alts=None):
-    _cache[ch] = {"url": url, "alts": alts or [], "ts": datetime.utcnow()}
+    now = datetime.utcnow()
+    ttl = _ttl_for(url)
+    if ttl <= 0: return
+    _cache.set(ch, {"url": url, "alts": alts or [], "ts": now, "exp": now + timedelta(seconds=ttl)})
+    _dirty.set()
+
+# ── Snapshot (warm start across restarts) ──
+_dirty = threading.Event()
+_snap = {"pid": None, "saved": None, "restored": 0}
+
+def save_snapshot():
+    """Atomically write every still-servable entry to CACHE_SNAPSHOT (tmp file + fsync + rename)."""
+    now = time.time()
+    rows = [{"ch": ch, "url": e["url"], "alts": e["alts"], "ts": _epoch(e["ts"]), "exp": _epoch(e["exp"])}
+            for ch, e in centries() if _epoch(e["exp"]) + STALE_MAX > now]
+    d = os.path.dirname(CACHE_SNAPSHOT)
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".cache-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"v": 1, "saved": now, "entries": rows}, f)
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, CACHE_SNAPSHOT)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+    _snap["saved"] = now
+    return len(rows)
+
+def load_snapshot():
+    """Reload entries that are still servable; never overwrite a newer shared-cache entry."""
+    try:
+        with open(CACHE_SNAPSHOT) as f: data = json.load(f)
+    except FileNotFoundError: return 0
+    except (OSError, ValueError) as e:
+        log.warning(f"Ignoring unreadable cache snapshot: {e}")
+        return 0
+    now, n = time.time(), 0
+    for r in data.get("entries", []):
+        try:
+            if r["exp"] + STALE_MAX <= now: continue
+            cur = _cache.get(r["ch"])
+            if cur and _epoch(cur["ts"]) >= r["ts"]: continue
+            _cache.set(r["ch"], {"url": r["url"], "alts": r["alts"], "ts": _dt(r["ts"]), "exp": _dt(r["exp"])})
+            n += 1
+        except (KeyError, TypeError): continue
+    if n: log.info(f"💾 Warm start: restored {n} channel(s) from {CACHE_SNAPSHOT}")
+    _snap["restored"] = n
+    return n
+
+def _snapshot_loop():
+    while True:
+        _dirty.wait()
+        time.sleep(CACHE_SNAPSHOT_INTERVAL)
+        _dirty.clear()
+        try: save_snapshot()
+        except Exception as e: log.warning(f"Cache snapshot failed: {e}")
+
+def _snapshot_on_exit():
+    if _dirty.is_set():
+        try: save_snapshot()
+        except Exception: pass
+
+def start_snapshots():
+    if not CACHE_SNAPSHOT or _snap["pid"] == os.getpid(): return
+    _snap["pid"] = os.getpid()
+    load_snapshot()
+    threading.Thread(target=_snapshot_loop, name="cache-snapshot", daemon=True).start()
+    atexit.register(_snapshot_on_exit)
 
 # ── Constants ──
 CHROME_ARGS = [
@@ -103,7 +455,7 @@ CHROME_ARGS = [
     "--disable-features=IsolateOrigins,site-per-process,TranslateUI",
     "--disable-blink-features=AutomationControlled",
     "--no-first-run","--no-default-browser-check",
-    "--single-process","--mute-audio",
+    "--mute-audio",
     "--autoplay-policy=no-user-gesture-required",
     "--disable-hang-monitor","--disable-component-update",
 ]
@@ -125,21 +477,72 @@ def _ua():
 BLOCKED = ["google-analytics.com","googletagmanager.com","facebook.net","facebook.com",
            "doubleclick.net","googlesyndication.com","hotjar.com","clarity.ms","sentry.io"]
 
+NOTE = "Fresh HLS link ~10-30min expiry. Play in VLC or hlsjs.video-dev.org/demo/"
+
 HLS_M = [".m3u8","wmsauthsign","playlist.m3u8","master.m3u8","chunklist","index.m3u8","jazzauth","manifest"]
-def _is_hls(u): return any(m in u.lower() for m in HLS_M)
+
+# ── Matchers, built once from the lists above ──
+def _prune(markers):
+    """Drop markers containing a shorter one from the same list; the shorter already matches."""
+    ms = sorted(set(m.lower() for m in markers), key=len)
+    return tuple(m for i, m in enumerate(ms) if not any(k in m for k in ms[:i]))
+
+_HLS_KEYS = _prune(HLS_M)  # ".m3u8" covers playlist/master/index.m3u8
+_BLOCKED_HOSTS = frozenset(d.lower() for d in BLOCKED if "/" not in d)
+_BLOCKED_KEYS = _prune(d for d in BLOCKED if "/" in d)  # path markers, if any, stay substring matches
+
+def _host(ul):
+    """Host of an already-lowercased absolute URL, without userinfo or port."""
+    h = ul[ul.find("//")+2:].split("/", 1)[0]
+    if "?" in h: h = h.split("?", 1)[0]
+    if "#" in h: h = h.split("#", 1)[0]
+    if "@" in h: h = h.rpartition("@")[2]
+    if ":" in h: h = h.partition(":")[0]
+    return h
+
+def _blocked_host(h):
+    """h or any parent domain in BLOCKED — a few set lookups however long the list gets."""
+    while True:
+        if h in _BLOCKED_HOSTS: return True
+        i = h.find(".")
+        if i < 0: return False
+        h = h[i+1:]
+
+def _is_hls(u):
+    ul = u.lower()
+    return any(m in ul for m in _HLS_KEYS)
 
 PREM_URL = ["/plans","/login","/subscribe","/signup","/otp","/get-pro","/signin","/auth"]
 PREM_TXT = ["please login","subscribe to watch","get tamasha pro","login to watch",
             "premium content","enter your otp","subscription required","enter mobile","jazz/warid"]
+_PREM_URL_KEYS = tuple(k.lower() for k in PREM_URL)  # list order kept: the first hit is the reason
+_PREM_TXT_KEYS = tuple(k.lower() for k in PREM_TXT)
 def _prem(url, txt=""):
     ul=url.lower()
-    for k in PREM_URL:
+    for k in _PREM_URL_KEYS:
         if k in ul: return True, k
-    tl=(txt or "").lower()
-    for k in PREM_TXT:
+    if not txt: return False, None
+    tl=txt.lower()
+    for k in _PREM_TXT_KEYS:
         if k in tl: return True, k
     return False, None
 
+BLOCKED_TYPES = {"image","font","stylesheet","media"}
+def _blocked(rt, url):
+    """Route-handler verdict: heavy static assets (unless HLS) and analytics/ad hosts."""
+    ul=url.lower()
+    if rt in BLOCKED_TYPES and ".m3u8" not in ul and ".ts" not in ul: return True
+    return _blocked_host(_host(ul)) or any(k in ul for k in _BLOCKED_KEYS)
+
+# The same policy as URL patterns for Chromium's own blocker (Network.setBlockedURLs),
+# which knows nothing of resource types: BLOCKED_TYPES become file extensions.
+BLOCKED_EXT = ["png","jpg","jpeg","gif","webp","avif","svg","ico","bmp",
+               "woff","woff2","ttf","otf","eot","css","mp4","webm","mp3","m4a","ogg"]
+_CDP_BLOCKED = ([p for d in sorted(_BLOCKED_HOSTS) for p in (f"*://{d}/*", f"*://*.{d}/*")]
+                + [f"*{k}*" for k in _BLOCKED_KEYS]
+                + [p for e in BLOCKED_EXT for p in (f"*.{e}", f"*.{e}?*")]
+                + ["*/_next/image?*"])  # Next.js image optimizer — no extension at the end
+
 def _score(u):
     s=0; ul=u.lower()
     if "playlist.m3u8" in ul: s+=100
@@ -155,18 +558,445 @@ def _score(u):
     s += len(parse_qs(urlparse(u).query)) * 8
     return s
 
+M3U8_RE = re.compile(r'(https?://[^\s"\'<>\\]*\.m3u8[^\s"\'<>\\]*)', re.I)
+def _unescape(t):
+    return t.replace("\\u0026","&").replace("\\/","/").replace("\\u003d","=").replace("&amp;","&")
+def _find_m3u8(text):
+    """m3u8 URLs in HTML/JSON text, JSON escapes undone first so queries stay whole."""
+    return M3U8_RE.findall(_unescape(text or ""))
+
+def _rank(captured):
+    """Dedup captured entries (ignoring nimblesessionid) and rank by _score → (url, score, alts, n)."""
+    seen=set(); uniq=[]
+    for e in captured:
+        k=e["url"].split("&nimblesessionid=")[0] if "&nimblesessionid=" in e["url"] else e["url"]
+        if k not in seen: seen.add(k); uniq.append(e)
+    best = max(uniq, key=lambda e:(_score(e["url"]),e["t"]))
+    alts = [e["url"] for e in sorted(uniq,key=lambda e:_score(e["url"]),reverse=True)]
+    return best["url"], _score(best["url"]), alts, len(uniq)
+
+
+# ══════════════════════════════════════════════════════════════════
+# Process accounting — /proc scan, no psutil dependency
+# ══════════════════════════════════════════════════════════════════
+def _ppids():
+    """Map pid → parent pid for every visible process ({} off Linux)."""
+    out = {}
+    try: names = os.listdir("/proc")
+    except OSError: return out
+    for d in names:
+        if not d.isdigit(): continue
+        try:
+            with open(f"/proc/{d}/stat") as f: st = f.read()
+            out[int(d)] = int(st.rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError): continue
+    return out
+
+def _descendants(pid, ppids=None):
+    ppids = _ppids() if ppids is None else ppids
+    kids = {}
+    for p, pp in ppids.items(): kids.setdefault(pp, []).append(p)
+    out, todo = [], [pid]
+    while todo:
+        for c in kids.get(todo.pop(), []): out.append(c); todo.append(c)
+    return out
+
+def _rss_mb(pids):
+    kb = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"): kb += int(line.split()[1]); break
+        except (OSError, ValueError): continue
+    return round(kb / 1024, 1)
+
 
 # ══════════════════════════════════════════════════════════════════
-# Shared browser helper — launches, navigates, returns page + browser
+# Warm browser pool — one long-lived Chromium, fresh context per job
 # ══════════════════════════════════════════════════════════════════
-def _launch_and_navigate(slug, block_resources=True):
+_launch_lock = threading.Lock()
+
+class _Browser:
+    """
+    A Chromium kept warm between extractions. Playwright's sync API is
+    bound to the thread that started it, so every method here must be
+    called from the thread that owns it (inside an extraction subprocess).
+    """
+    def __init__(self):
+        self.pw = None
+        self.browser = None
+        self.pids = []
+        self.alive = False
+        self.launched_at = None
+        self.uses = 0
+        self.total_uses = 0
+        self.launches = 0
+        self.recycles = 0
+        self.crashes = 0
+
+    def ensure(self):
+        if self.browser and self.alive:
+            return self.browser
+        if self.browser:
+            self.crashes += 1
+            log.warning("⚠ Browser disconnected — relaunching")
+            self.close()
+        t0 = time.time()
+        with _launch_lock:
+            before = set(_descendants(os.getpid()))
+            self.pw = sync_playwright().start()
+            try:
+                self.browser = self.pw.chromium.launch(headless=True, args=CHROME_ARGS)
+            except Exception:
+                self.close()  # a half-started Playwright poisons every later launch
+                raise
+            ppids = _ppids()
+            new = set(_descendants(os.getpid(), ppids)) - before
+        # Roots of the new subtree: the Playwright driver, with Chromium beneath it
+        self.pids = sorted(p for p in new if ppids.get(p) not in new)
+        self.browser.on("disconnected", lambda _: setattr(self, "alive", False))
+        self.alive = True
+        self.launched_at = time.time()
+        self.uses = 0
+        self.launches += 1
+        log.info(f"🚀 Browser launched in {time.time()-t0:.1f}s (pids={self.pids})")
+        return self.browser
+
+    def rss_mb(self):
+        pids = list(self.pids)
+        ppids = _ppids()
+        for p in self.pids: pids += _descendants(p, ppids)
+        return _rss_mb(pids)
+
+    def after_use(self):
+        self.uses += 1
+        self.total_uses += 1
+        if not self.alive: return
+        why = None
+        if self.uses >= BROWSER_MAX_USES: why = f"{self.uses} uses"
+        else:
+            rss = self.rss_mb()
+            if rss > BROWSER_MAX_RSS_MB: why = f"RSS {rss}MB"
+        if why:
+            log.info(f"♻ Recycling browser ({why})")
+            self.recycles += 1
+            self.close()
+            self.warm()
+
+    def check(self):
+        """Idle health check: relaunch a dead browser, recycle a bloated one."""
+        if self.browser and not self.alive:
+            self.warm()
+        elif self.alive and self.rss_mb() > BROWSER_MAX_RSS_MB:
+            log.info("♻ Recycling idle browser (RSS)")
+            self.recycles += 1
+            self.close()
+            self.warm()
+
+    def warm(self):
+        try: self.ensure()
+        except Exception as e: log.error(f"Browser launch failed: {e}")
+
+    def close(self):
+        try:
+            if self.browser: self.browser.close()
+        except: pass
+        try:
+            if self.pw: self.pw.stop()
+        except: pass
+        self.pw = self.browser = None
+        self.pids = []
+        self.alive = False
+
+    def stats(self):
+        return {
+            "alive": self.alive,
+            "pids": self.pids,
+            "rss_mb": self.rss_mb() if self.alive else 0,
+            "uptime_s": int(time.time() - self.launched_at) if self.alive else 0,
+            "uses_since_launch": self.uses, "total_uses": self.total_uses,
+            "launches": self.launches, "recycles": self.recycles, "crashes": self.crashes,
+        }
+
+
+class PoolSaturated(Exception):
+    """Raised when the extraction queue is already at EXTRACT_QUEUE_DEPTH."""
+
+# Queue priorities — lower runs first
+PRIO_INTERACTIVE, PRIO_ASYNC, PRIO_BACKGROUND = 0, 1, 2
+
+
+# ── Extraction subprocesses ──
+_mp = multiprocessing.get_context("spawn")
+_IN_WORKER = _mp.parent_process() is not None  # True inside an extraction subprocess
+
+def _worker_main(conn):
     """
-    Launch browser, navigate to channel page, return (browser, page, nav_info).
-    Caller MUST close browser in finally block.
+    Extraction subprocess: owns one warm _Browser and runs (fn_name, args)
+    jobs from the pipe until the parent goes away. Replies with
+    (status, value, browser_stats) before any recycle so callers don't wait on it.
+    """
+    b = _Browser()
+    if BROWSER_PREWARM: b.warm()
+    while True:
+        try:
+            if not conn.poll(BROWSER_HEALTH_INTERVAL):
+                b.check(); continue
+            name, args = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            break
+        try:
+            n, t0 = b.launches, time.time()
+            browser = b.ensure()
+            launch_s = round(time.time() - t0, 3) if b.launches > n else None
+            out = ("ok", globals()[name](browser, *args))
+            if launch_s is not None and isinstance(out[1], dict) and "_stages" in out[1]:
+                out[1]["_stages"]["launch"] = launch_s
+                if out[1].get("_trace"): out[1]["_trace"]["launch_ms"] = int(launch_s * 1000)
+        except Exception as e:
+            out = ("err", f"{e.__class__.__name__}: {e}"[:500])
+        try:
+            conn.send((*out, b.stats()))
+        except (OSError, ValueError):
+            break
+        try: b.after_use()
+        except Exception as e: log.error(f"Browser recycle error: {e}")
+    b.close()
+
+
+class _Worker:
     """
-    pw_instance = sync_playwright().start()
-    browser = pw_instance.chromium.launch(headless=True, args=CHROME_ARGS)
+    Parent-side handle on one extraction subprocess. call() enforces a hard
+    wall-clock deadline: on expiry the subprocess and everything under it
+    (Playwright driver, Chromium) is SIGKILLed and a fresh one spawned.
+    """
+    def __init__(self, idx):
+        self.idx = idx
+        self.proc = None
+        self.conn = None
+        self.browser = {}
+        self.spawns = 0
+        self.kills = 0
+        self.deaths = 0
+
+    def alive(self):
+        return self.proc is not None and self.proc.is_alive()
+
+    def spawn(self):
+        parent, child = _mp.Pipe()
+        p = _mp.Process(target=_worker_main, args=(child,), name=f"extract-{self.idx}", daemon=True)
+        p.start()
+        child.close()
+        self.proc, self.conn = p, parent
+        self.spawns += 1
+        log.info(f"🧩 Extraction worker {self.idx} started (pid={p.pid})")
+
+    def ensure(self):
+        if self.alive(): return
+        if self.proc:
+            self.deaths += 1
+            log.warning(f"⚠ Extraction worker {self.idx} died (exit={self.proc.exitcode}) — replacing")
+            self.kill()
+        self.spawn()
+
+    def call(self, fn, args, deadline):
+        """Run fn(browser, *args) in the subprocess → ("ok"|"err"|"killed"|"died", value)."""
+        self.ensure()
+        self.conn.send((fn.__name__, args))
+        if not self.conn.poll(deadline):
+            self.kills += 1
+            log.error(f"⏱ {fn.__name__}{args} exceeded {deadline}s — killing worker {self.idx}")
+            self.kill(); self.spawn()
+            return "killed", None
+        try:
+            status, value, self.browser = self.conn.recv()
+            return status, value
+        except (EOFError, OSError):
+            self.deaths += 1
+            self.kill(); self.spawn()
+            return "died", None
+
+    def kill(self):
+        if not self.proc: return
+        pids = [self.proc.pid] + _descendants(self.proc.pid)  # collect first: orphans get reparented
+        for p in pids:
+            try: os.kill(p, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError): pass
+        self.proc.join(5)
+        try: self.conn.close()
+        except OSError: pass
+        self.proc = self.conn = None
+
+    def stats(self):
+        pid = self.proc.pid if self.alive() else None
+        return {
+            "worker": self.idx, "pid": pid,
+            "tree_rss_mb": _rss_mb([pid] + _descendants(pid)) if pid else 0,
+            "spawns": self.spawns, "kills": self.kills, "deaths": self.deaths,
+            "browser": self.browser,
+        }
+
+
+class _BrowserPool:
+    """
+    EXTRACT_CONCURRENCY supervisor threads, each driving one extraction
+    subprocess (which owns one warm browser), fed from a bounded priority
+    queue. Request threads hand jobs over with run(fn, *args); fn must be a
+    module-level function and is called as fn(browser, *args) in the
+    subprocess. Started lazily per process so gunicorn --preload forks get
+    their own.
+    """
+    def __init__(self, size=EXTRACT_CONCURRENCY, depth=EXTRACT_QUEUE_DEPTH):
+        self.size = size
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.pid = None
+        self.threads = []
+        self.slots = []
+        self.jobs = queue.PriorityQueue(maxsize=depth)
+        self.seq = itertools.count()
+        self.active = 0
+        self.done = 0
+        self.rejected = 0
+        self.avg_s = 20.0  # EMA of job duration, for ETAs
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid() and all(t.is_alive() for t in self.threads):
+                return
+            if self.pid != os.getpid():
+                self.jobs = queue.PriorityQueue(maxsize=self.depth)
+                self.threads, self.slots = [], []
+                atexit.register(self.shutdown)
+            self.pid = os.getpid()
+            for i in range(self.size):
+                if i < len(self.threads) and self.threads[i].is_alive(): continue
+                w = self.slots[i] if i < len(self.slots) else _Worker(i)
+                t = threading.Thread(target=self._loop, args=(w,), name=f"extract-{i}", daemon=True)
+                if i < len(self.threads): self.threads[i] = t
+                else: self.threads.append(t); self.slots.append(w)
+                t.start()
+    def submit(self, fn, *args, priority=PRIO_INTERACTIVE, wait_s=0):
+        """Queue fn; with wait_s > 0 block up to that long for queue space instead of failing."""
+        self.start()
+        fut = Future()
+        fut.order = (priority, next(self.seq))
+        try:
+            self.jobs.put((*fut.order, fut, fn, args), block=wait_s > 0, timeout=wait_s or None)
+        except queue.Full:
+            self.rejected += 1
+            raise PoolSaturated(f"{self.depth} extractions already queued")
+        return fut
+
+    def wait(self, fut, timeout=EXTRACT_TIMEOUT):
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            fut.cancel()  # drop it if it never left the queue
+            raise
+
+    def run(self, fn, *args, timeout=EXTRACT_TIMEOUT, priority=PRIO_INTERACTIVE):
+        return self.wait(self.submit(fn, *args, priority=priority), timeout)
+
+    def position(self, fut):
+        """Jobs queued ahead of fut (0 = next), or None once it left the queue."""
+        if fut.done() or fut.running(): return None
+        with self.jobs.mutex:
+            return sum(1 for item in self.jobs.queue if item[:2] < fut.order)
+
+    def eta(self, ahead):
+        """Rough seconds until a job with `ahead` jobs in front of it finishes."""
+        return round(((ahead + self.active) // self.size + 1) * self.avg_s, 1)
+
+    def _loop(self, w):
+        if BROWSER_PREWARM:
+            try: w.ensure()
+            except Exception as e: log.error(f"Extraction worker {w.idx} failed to start: {e}")
+        while True:
+            try: _, _, fut, fn, args = self.jobs.get(timeout=BROWSER_HEALTH_INTERVAL)
+            except queue.Empty:
+                if not (BROWSER_PREWARM or w.proc): continue  # lazy: nothing to keep alive yet
+                try: w.ensure()
+                except Exception as e: log.error(f"Extraction worker {w.idx} failed to start: {e}")
+                continue
+            if not fut.set_running_or_notify_cancel(): continue
+            with self.lock: self.active += 1
+            t0 = time.time()
+            try:
+                status, value = w.call(fn, args, EXTRACT_DEADLINE)
+                if status == "ok": fut.set_result(value)
+                elif status == "err": fut.set_exception(RuntimeError(value))
+                else: fut.set_result({"success":False,
+                                      "error":f"Extraction worker {status} (hard deadline {EXTRACT_DEADLINE}s).",
+                                      **({"failure_class":"capacity"} if status == "died" else {})})
+            except BaseException as e:
+                fut.set_exception(e)
+            finally:
+                with self.lock:
+                    self.active -= 1; self.done += 1
+                    self.avg_s = 0.8 * self.avg_s + 0.2 * (time.time() - t0)
+
+    def shutdown(self):
+        if self.pid != os.getpid(): return
+        for w in self.slots:
+            try: w.kill()
+            except Exception: pass
+
+    def stats(self):
+        return {
+            "size": self.size, "active": self.active, "queued": self.jobs.qsize(),
+            "queue_depth": self.depth, "completed": self.done, "rejected": self.rejected,
+            "avg_job_s": round(self.avg_s, 1), "deadline_s": EXTRACT_DEADLINE,
+            "workers": [w.stats() for w in self.slots] if self.pid == os.getpid() else [],
+        }
 
+_pool = _BrowserPool()
+
+
+class _Trace:
+    """
+    Nested timing spans for one extraction, for ?trace=1 and /api/traces.
+    span() nests under whichever span is open; each node is JSON-ready:
+    {"name", "at_ms" (offset from its parent's start), "ms", **attrs,
+    "children"}. Spans with stage=True also add their seconds to .stages
+    for the /metrics histograms. One trace belongs to one thread.
+    """
+    def __init__(self, name, **attrs):
+        self.t0 = time.time()
+        self.root = {"name": name, "at_ms": 0, "ms": None, **attrs, "children": []}
+        self.stack = [(self.root, self.t0)]
+        self.stages = {}
+
+    @contextmanager
+    def span(self, name, stage=True, **attrs):
+        parent, pt = self.stack[-1]
+        t = time.time()
+        node = {"name": name, "at_ms": int((t - pt) * 1000), "ms": None, **attrs, "children": []}
+        parent["children"].append(node)
+        self.stack.append((node, t))
+        try:
+            yield node
+        finally:
+            dt = time.time() - t
+            self.stack.pop()
+            node["ms"] = int(dt * 1000)
+            if not node["children"]: del node["children"]
+            if stage: self.stages[name] = round(self.stages.get(name, 0) + dt, 3)
+
+    def attach(self, node, tree):
+        """Graft a finished subtree (e.g. from the extraction subprocess) under node, ending now."""
+        _, nt = next((x for x in self.stack if x[0] is node), (None, self.t0))
+        tree["at_ms"] = max(0, int((time.time() - nt) * 1000) - (tree["ms"] or 0))
+        node.setdefault("children", []).append(tree)
+
+    def finish(self):
+        self.root["ms"] = int((time.time() - self.t0) * 1000)
+        return self.root
+
+
+def _new_context(browser):
+    """Fresh incognito context with the desktop fingerprint and stealth script."""
     ctx = browser.new_context(
         user_agent=_ua(),
         viewport={"width": 1366, "height": 768},
@@ -182,35 +1012,135 @@ def _launch_and_navigate(slug, block_resources=True):
         },
     )
     ctx.add_init_script(STEALTH)
+    return ctx
 
-    if block_resources:
-        def rh(route):
-            rt = route.request.resource_type
-            ru = route.request.url.lower()
-            if rt in {"image","font","stylesheet","media"}:
-                if ".m3u8" not in ru and ".ts" not in ru:
-                    route.abort(); return
-            for d in BLOCKED:
-                if d in ru: route.abort(); return
-            route.continue_()
-        ctx.route("**/*", rh)
-
-    page = ctx.new_page()
-    target = f"{TAMASHA}/{slug}"
 
+def _block_requests(ctx, page):
+    """
+    Drop analytics hosts and heavy assets inside Chromium via CDP, so no
+    sub-resource request waits on a round-trip to this process. Falls back
+    to routing every request through _blocked when CDP is off or fails.
+    Must run before the page navigates. Returns "cdp" or "route".
+    """
+    if CDP_BLOCKING:
+        try:
+            cdp = ctx.new_cdp_session(page)
+            cdp.send("Network.enable")
+            cdp.send("Network.setBlockedURLs", {"urls": _CDP_BLOCKED})
+            return "cdp"
+        except Exception as e:
+            log.warning(f"CDP blocking unavailable ({e.__class__.__name__}) — using route handler")
+    def rh(route):
+        if _blocked(route.request.resource_type, route.request.url): route.abort()
+        else: route.continue_()
+    ctx.route("**/*", rh)
+    return "route"
+
+
+def _launch_and_navigate(browser, slug, block_resources=True, on_response=None, on_failed=None, trace=None):
+    """
+    Open a fresh context on the warm browser, attach listeners, navigate to
+    the channel page and wait for the first useful signal (see _wait_for_signal).
+    Returns (ctx, page, target, nav_status, waits, signals). Caller MUST close
+    ctx in finally. Records context/goto/nav_signal spans on trace if given.
+    """
+    trace = trace or _Trace("navigate")
+    with trace.span("context") as sp:
+        ctx = _new_context(browser)
+        page = ctx.new_page()
+        if block_resources: sp["blocking"] = _block_requests(ctx, page)
+    signals = {"hls": False}
+    def on_hls(resp):
+        try:
+            if not signals["hls"] and _is_hls(resp.url): signals["hls"] = True
+        except: pass
+    page.on("response", on_hls)
+    if on_response: page.on("response", on_response)
+    if on_failed: page.on("requestfailed", on_failed)
+
+    target = f"{TAMASHA}/{slug}"
+    waits = []
     nav_status = None
-    try:
-        r = page.goto(target, wait_until="domcontentloaded", timeout=NAV_TIMEOUT)
-        nav_status = r.status if r else None
-    except PlaywrightTimeout:
-        nav_status = "TIMEOUT"
+    t0 = time.time()
+    with trace.span("goto", url=target) as sp:
+        try:
+            r = page.goto(target, wait_until="domcontentloaded", timeout=NAV_TIMEOUT)
+            nav_status = r.status if r else None
+        except PlaywrightTimeout:
+            nav_status = "TIMEOUT"
+        sp["status"] = nav_status
+    waits.append({"wait": "goto", "s": round(time.time() - t0, 2), "status": nav_status})
+
+    _wait_for_signal(page, signals, NAV_SIGNAL_TIMEOUT, "nav_signal", waits, trace)
+    return ctx, page, target, nav_status, waits, signals
 
-    try:
-        page.wait_for_load_state("networkidle", timeout=12000)
-    except PlaywrightTimeout:
-        pass
 
-    return pw_instance, browser, page, target, nav_status
+def _wait_for_signal(page, signals, timeout_s, name, waits, trace=None):
+    """
+    Wait for whichever extraction signal comes first — an HLS response, a
+    <video> element in any frame, or a premium redirect — rather than for
+    networkidle, which Tamasha's analytics traffic keeps from settling.
+    Records {"wait": name, "signal", "s"} in waits (and a span on trace);
+    returns the signal or None.
+    """
+    t0 = time.time()
+    deadline = t0 + timeout_s
+    sig = None
+    with (trace or _Trace(name)).span(name) as sp:
+        while True:
+            if signals["hls"]: sig = "hls"
+            elif _prem(page.url)[0]: sig = "premium"
+            else:
+                try:
+                    if any(fr.query_selector("video") for fr in page.frames): sig = "video"
+                except Exception: pass
+            left = deadline - time.time()
+            if sig or left <= 0: break
+            page.wait_for_timeout(max(1, int(min(0.2, left) * 1000)))
+        sp["signal"] = sig
+    dt = round(time.time() - t0, 2)
+    waits.append({"wait": name, "signal": sig, "s": dt})
+    log.info(f"  ⏱ {name}: {sig or 'timeout'} after {dt}s")
+    return sig
+
+
+def _page_prem(page):
+    """_prem verdict for the page's current URL and the start of its body text."""
+    try: body = page.evaluate("()=>document.body?document.body.innerText.substring(0,3000):''")
+    except Exception: body = ""
+    return _prem(page.url, body)
+
+
+def _wait_for_hls(page, captured, max_s):
+    """
+    Event-driven replacement for a fixed sleep. Pumps Playwright events in
+    short slices (time.sleep would not deliver responses to the handlers)
+    until a captured URL scores >= HLS_SCORE_THRESHOLD, then listens
+    HLS_GRACE more seconds for better candidates. Falls back to max_s.
+    Also stops early if the page leaves for a premium URL (a client-side
+    redirect after hydration). Returns (seconds_waited, early_exit).
+    """
+    t0 = time.time()
+    deadline = t0 + max_s
+    hit = False
+    seen = 0
+    while True:
+        now = time.time()
+        if not captured and _prem(page.url)[0]:
+            log.info(f"  Redirected to {page.url[:80]} after {now-t0:.1f}s")
+            break
+        if not hit:
+            for e in captured[seen:]:
+                if _score(e["url"]) >= HLS_SCORE_THRESHOLD:
+                    hit = True
+                    deadline = min(deadline, now + HLS_GRACE)
+                    log.info(f"  ⚡ High-confidence HLS after {now-t0:.1f}s")
+                    break
+            seen = len(captured)
+        left = deadline - now
+        if left <= 0: break
+        page.wait_for_timeout(max(1, int(min(0.25, left) * 1000)))
+    return round(time.time() - t0, 2), hit
 
 
 def _click_play(page):
@@ -251,7 +1181,7 @@ def _click_play(page):
 # ══════════════════════════════════════════════════════════════════
 # Debug Extraction
 # ══════════════════════════════════════════════════════════════════
-def do_debug(slug):
+def do_debug(browser, slug):
     log.info(f"🔍 Debug: {slug}")
     responses = []
 
@@ -259,123 +1189,115 @@ def do_debug(slug):
         try: responses.append({"url":resp.url[:300],"status":resp.status,"type":resp.request.resource_type})
         except: pass
 
-    pw = browser = page = None
+    tr = _Trace("debug", slug=slug)
+    ctx = page = None
     try:
-        pw, browser, page, target, nav_status = _launch_and_navigate(slug, block_resources=False)
-        page.on("response", on_r)
-
-        # Re-navigate to capture responses (since we attached listener after first nav)
-        try:
-            page.reload(wait_until="domcontentloaded", timeout=25000)
-        except PlaywrightTimeout:
-            pass
-        try:
-            page.wait_for_load_state("networkidle", timeout=12000)
-        except PlaywrightTimeout:
-            pass
+        # Listener is attached before navigation, so no reload is needed to see responses
+        ctx, page, target, nav_status, waits, _ = _launch_and_navigate(
+            browser, slug, block_resources=False, on_response=on_r, trace=tr)
 
-        _click_play(page)
-        time.sleep(8)
+        with tr.span("click_play"): _click_play(page)
+        with tr.span("settle"): page.wait_for_timeout(8000)
 
-        cur = page.url
-        title = ""
-        try: title = page.title()
-        except: pass
+        with tr.span("probe"):
+            cur = page.url
+            title = ""
+            try: title = page.title()
+            except: pass
 
-        # Video elements
-        vinfo = []
-        try:
-            vinfo = page.evaluate("""()=>{
-                const r=[];
-                document.querySelectorAll('video').forEach((v,i)=>{
-                    r.push({i,src:v.src||null,currentSrc:v.currentSrc||null,
-                        paused:v.paused,readyState:v.readyState,networkState:v.networkState,
-                        duration:v.duration,id:v.id||null,cls:v.className||null,
-                        sources:Array.from(v.querySelectorAll('source')).map(s=>({src:s.src,type:s.type}))
+            # Video elements
+            vinfo = []
+            try:
+                vinfo = page.evaluate("""()=>{
+                    const r=[];
+                    document.querySelectorAll('video').forEach((v,i)=>{
+                        r.push({i,src:v.src||null,currentSrc:v.currentSrc||null,
+                            paused:v.paused,readyState:v.readyState,networkState:v.networkState,
+                            duration:v.duration,id:v.id||null,cls:v.className||null,
+                            sources:Array.from(v.querySelectorAll('source')).map(s=>({src:s.src,type:s.type}))
+                        });
                     });
-                });
-                return r;
-            }""")
-        except Exception as e: vinfo=[{"error":str(e)}]
+                    return r;
+                }""")
+            except Exception as e: vinfo=[{"error":str(e)}]
 
-        # Iframes
-        iinfo = []
-        try:
-            iinfo = page.evaluate("""()=>Array.from(document.querySelectorAll('iframe')).slice(0,5).map((f,i)=>({
-                i,src:f.src||null,id:f.id||null,cls:f.className||null
-            }))""")
-        except: pass
+            # Iframes
+            iinfo = []
+            try:
+                iinfo = page.evaluate("""()=>Array.from(document.querySelectorAll('iframe')).slice(0,5).map((f,i)=>({
+                    i,src:f.src||null,id:f.id||null,cls:f.className||null
+                }))""")
+            except: pass
 
-        # Player libs
-        plibs = {}
-        try:
-            plibs = page.evaluate("""()=>({
-                hls:typeof Hls!=='undefined',
-                videojs:typeof videojs!=='undefined',
-                jw:typeof jwplayer!=='undefined',
-                shaka:typeof shaka!=='undefined',
-                dash:typeof dashjs!=='undefined',
-                bitmovin:typeof bitmovin!=='undefined',
-                clappr:typeof Clappr!=='undefined',
-            })""")
-        except Exception as e: plibs={"error":str(e)}
-
-        # Tamasha-specific globals
-        tglobals = {}
-        try:
-            tglobals = page.evaluate("""()=>{
-                const r={};
-                for(const k of Object.keys(window)){
-                    const kl=k.toLowerCase();
-                    if(kl.includes('player')||kl.includes('stream')||kl.includes('hls')||kl.includes('video'))
-                        r[k]=typeof window[k];
-                }
-                return r;
-            }""")
-        except: pass
+            # Player libs
+            plibs = {}
+            try:
+                plibs = page.evaluate("""()=>({
+                    hls:typeof Hls!=='undefined',
+                    videojs:typeof videojs!=='undefined',
+                    jw:typeof jwplayer!=='undefined',
+                    shaka:typeof shaka!=='undefined',
+                    dash:typeof dashjs!=='undefined',
+                    bitmovin:typeof bitmovin!=='undefined',
+                    clappr:typeof Clappr!=='undefined',
+                })""")
+            except Exception as e: plibs={"error":str(e)}
+
+            # Tamasha-specific globals
+            tglobals = {}
+            try:
+                tglobals = page.evaluate("""()=>{
+                    const r={};
+                    for(const k of Object.keys(window)){
+                        const kl=k.toLowerCase();
+                        if(kl.includes('player')||kl.includes('stream')||kl.includes('hls')||kl.includes('video'))
+                            r[k]=typeof window[k];
+                    }
+                    return r;
+                }""")
+            except: pass
 
-        # __NEXT_DATA__
-        ndata = None
-        try:
-            ndata = page.evaluate("""()=>{
-                const el=document.getElementById('__NEXT_DATA__');
-                if(!el)return 'NOT_FOUND';
-                try{
-                    const d=JSON.parse(el.textContent);
-                    const pp=d.props?.pageProps||{};
-                    // Return keys and any stream-related values
-                    const info={keys:Object.keys(pp)};
-                    for(const[k,v] of Object.entries(pp)){
-                        if(typeof v==='string'&&(v.includes('.m3u8')||v.includes('stream')||v.includes('http')))
-                            info[k]=v;
-                        if(typeof v==='object'&&v!==null){
-                            const vs=JSON.stringify(v);
-                            if(vs.includes('.m3u8')||vs.includes('stream_url')||vs.includes('wmsAuth'))
-                                info[k+'_snippet']=vs.substring(0,500);
+            # __NEXT_DATA__
+            ndata = None
+            try:
+                ndata = page.evaluate("""()=>{
+                    const el=document.getElementById('__NEXT_DATA__');
+                    if(!el)return 'NOT_FOUND';
+                    try{
+                        const d=JSON.parse(el.textContent);
+                        const pp=d.props?.pageProps||{};
+                        // Return keys and any stream-related values
+                        const info={keys:Object.keys(pp)};
+                        for(const[k,v] of Object.entries(pp)){
+                            if(typeof v==='string'&&(v.includes('.m3u8')||v.includes('stream')||v.includes('http')))
+                                info[k]=v;
+                            if(typeof v==='object'&&v!==null){
+                                const vs=JSON.stringify(v);
+                                if(vs.includes('.m3u8')||vs.includes('stream_url')||vs.includes('wmsAuth'))
+                                    info[k+'_snippet']=vs.substring(0,500);
+                            }
                         }
-                    }
-                    return info;
-                }catch(e){return 'PARSE_ERROR: '+e.message}
-            }""")
-        except: pass
+                        return info;
+                    }catch(e){return 'PARSE_ERROR: '+e.message}
+                }""")
+            except: pass
 
-        # Body text
-        body = ""
-        try: body = page.evaluate("()=>document.body?document.body.innerText.substring(0,2000):''")
-        except: pass
+            # Body text
+            body = ""
+            try: body = page.evaluate("()=>document.body?document.body.innerText.substring(0,2000):''")
+            except: pass
 
-        # HLS responses
-        hls_r = [r for r in responses if any(m in r["url"].lower() for m in
-                 [".m3u8","wmsauth","playlist","manifest","hls","stream","nimble"])]
-        xhr = [r for r in responses if r["type"] in ("fetch","xhr")]
+            # HLS responses
+            hls_r = [r for r in responses if any(m in r["url"].lower() for m in
+                     [".m3u8","wmsauth","playlist","manifest","hls","stream","nimble"])]
+            xhr = [r for r in responses if r["type"] in ("fetch","xhr")]
 
-        # m3u8 in source
-        m3u8s = []
-        try:
-            html = page.content()
-            for m in re.findall(r'(https?://[^\s"\'<>\\]*\.m3u8[^\s"\'<>\\]*)', html, re.I):
-                m3u8s.append(m.replace("\\u0026","&").replace("\\/","/").replace("\\u003d","=")[:400])
-        except: pass
+            # m3u8 in source
+            m3u8s = []
+            try:
+                html = page.content()
+                m3u8s = [m[:400] for m in _find_m3u8(html)]
+            except: pass
 
         prem, pr = _prem(cur, body)
 
@@ -387,30 +1309,36 @@ def do_debug(slug):
             "hls_responses":hls_r[:20], "xhr_responses":xhr[:30],
             "m3u8_in_source":m3u8s[:10],
             "total_responses":len(responses),
+            "waits":waits,
             "body_preview":body[:1000],
             "premium":{"is":prem,"reason":pr},
+            "_trace":tr.root,
         }
 
     except Exception as e:
         log.error(f"Debug error: {e}", exc_info=True)
-        return {"error": str(e)}
+        return {"error": str(e), "_trace":tr.root}
     finally:
-        try:
-            if browser: browser.close()
-        except: pass
-        try:
-            if pw: pw.stop()
-        except: pass
+        with tr.span("teardown"):
+            try:
+                if ctx: ctx.close()
+            except: pass
+        tr.finish()
 
 
 # ══════════════════════════════════════════════════════════════════
 # Main Extraction
 # ══════════════════════════════════════════════════════════════════
-def do_extract(slug):
+def do_extract(browser, slug):
     log.info(f"▶ Extract: {slug}")
     captured = []
     failed = []
+    xhrs = []
+    recipe = None
     video_found = False
+    hls_wait, early = 0, False
+    waits = []
+    tr = _Trace("extract", slug=slug)  # spans for ?trace=1; leaf spans also feed /metrics
 
     def on_r(resp):
         try:
@@ -418,6 +1346,8 @@ def do_extract(slug):
             if _is_hls(u) and 200<=resp.status<400:
                 captured.append({"url":u,"status":resp.status,"t":time.time()})
                 log.info(f"  ✓ [{resp.status}] {u[:180]}")
+            elif resp.request.resource_type in ("fetch","xhr") and len(xhrs) < 60:
+                xhrs.append(resp)
         except: pass
 
     def on_f(req):
@@ -426,11 +1356,10 @@ def do_extract(slug):
                 failed.append({"url":req.url[:150],"err":req.failure})
         except: pass
 
-    pw = browser = page = None
+    ctx = page = None
     try:
-        pw, browser, page, target, nav_status = _launch_and_navigate(slug)
-        page.on("response", on_r)
-        page.on("requestfailed", on_f)
+        ctx, page, target, nav_status, waits, signals = _launch_and_navigate(
+            browser, slug, on_response=on_r, on_failed=on_f, trace=tr)
 
         cur = page.url
         log.info(f"  Landed: {cur}")
@@ -438,159 +1367,184 @@ def do_extract(slug):
         # If redirected away, try alt URLs
         if slug not in cur.lower().replace("-","") and not captured:
             for alt in [f"{TAMASHA}/watch/{slug}", f"{TAMASHA}/live/{slug}"]:
-                try:
-                    page.goto(alt, wait_until="domcontentloaded", timeout=20000)
-                    cur = page.url
-                    if "404" not in (page.title() or "").lower():
-                        try: page.wait_for_load_state("networkidle", timeout=10000)
-                        except PlaywrightTimeout: pass
-                        break
-                except: continue
+                with tr.span("alt_goto", url=alt):
+                    try:
+                        page.goto(alt, wait_until="domcontentloaded", timeout=20000)
+                        cur = page.url
+                        found = "404" not in (page.title() or "").lower()
+                    except: continue
+                if found:
+                    _wait_for_signal(page, signals, 10, "alt_signal", waits, tr)
+                    break
 
         # Premium check
-        try: body = page.evaluate("()=>document.body?document.body.innerText.substring(0,3000):''")
-        except: body = ""
-        prem, reason = _prem(page.url, body)
+        with tr.span("premium_check"):
+            prem, reason = _page_prem(page)
         if prem:
-            return {"success":False,"error":"Premium — login required.","reason":reason}
+            return {"success":False,"error":"Premium — login required.","reason":reason,
+                    "_stages":tr.stages,"_trace":tr.root}
 
-        # Find video
-        for sel in ["video",".video-js video",".jw-video","video[src]"]:
+        # Find video (".video-js video", ".jw-video" and "video[src]" are all
+        # <video> elements, so one wait on "video" covers them)
+        t0 = time.time()
+        with tr.span("video_selector") as sp:
             try:
-                page.wait_for_selector(sel, timeout=6000)
+                page.wait_for_selector("video", timeout=6000)
                 video_found = True
-                log.info(f"  ✓ Video: {sel}")
-                break
-            except PlaywrightTimeout: continue
+                log.info("  ✓ Video")
+            except PlaywrightTimeout: pass
+            sp["found"] = video_found
+        waits.append({"wait":"video_selector","signal":"video" if video_found else None,"s":round(time.time()-t0,2)})
 
         if not video_found:
-            try:
-                for f in page.query_selector_all("iframe"):
-                    try:
-                        fr = f.content_frame()
-                        if fr:
-                            fr.wait_for_selector("video", timeout=4000)
-                            video_found = True
-                            log.info("  ✓ Video in iframe")
-                            break
-                    except: continue
-            except: pass
-
-        _click_play(page)
+            t0 = time.time()
+            with tr.span("iframe_video") as sp:
+                try:
+                    for i, f in enumerate(page.query_selector_all("iframe")):
+                        with tr.span("iframe", stage=False, i=i):
+                            try:
+                                fr = f.content_frame()
+                                if fr:
+                                    fr.wait_for_selector("video", timeout=4000)
+                                    video_found = True
+                                    log.info("  ✓ Video in iframe")
+                            except: continue
+                        if video_found: break
+                except: pass
+                sp["found"] = video_found
+            waits.append({"wait":"iframe_video","signal":"video" if video_found else None,"s":round(time.time()-t0,2)})
+
+        with tr.span("click_play"): _click_play(page)
 
         # ── Main wait for HLS ──
-        log.info(f"  Waiting {EXTRA_WAIT}s...")
-        time.sleep(EXTRA_WAIT)
+        log.info(f"  Waiting up to {EXTRA_WAIT}s...")
+        with tr.span("hls") as sp:
+            hls_wait, early = _wait_for_hls(page, captured, EXTRA_WAIT)
+            sp.update(early=early, captured=len(captured))
+        waits.append({"wait":"hls","signal":"hls" if early else None,"s":hls_wait})
 
         # ── Deep extraction if needed ──
         if not captured:
-            log.info("  Deep extraction...")
-
-            # A: video.src
-            try:
-                srcs = page.evaluate("""()=>{
-                    const s=new Set();
-                    document.querySelectorAll('video').forEach(v=>{
-                        if(v.src)s.add(v.src);if(v.currentSrc)s.add(v.currentSrc);
-                        v.querySelectorAll('source').forEach(x=>{if(x.src)s.add(x.src)});
-                    });
-                    document.querySelectorAll('iframe').forEach(f=>{
-                        try{const d=f.contentDocument||f.contentWindow.document;
-                        d.querySelectorAll('video').forEach(v=>{if(v.src)s.add(v.src);if(v.currentSrc)s.add(v.currentSrc)});}catch(e){}
-                    });
-                    return[...s];
-                }""")
-                for src in (srcs or []):
-                    if src and _is_hls(src):
-                        captured.append({"url":src,"status":200,"t":time.time()})
-                        log.info(f"  ✓ src: {src[:160]}")
-            except: pass
-
-            # B: Player JS objects
-            try:
-                ps = page.evaluate("""()=>{
-                    const u=[];
-                    try{document.querySelectorAll('video').forEach(v=>{
-                        for(const k of Object.keys(v)){const o=v[k];
-                        if(o&&typeof o==='object'){
-                            if(o.url&&typeof o.url==='string')u.push(o.url);
-                            if(o.levels)o.levels.forEach(l=>{if(l.url)u.push(l.url);if(l.uri)u.push(l.uri)});
-                        }}});
-                    }catch(e){}
-                    try{if(window.videojs){
-                        const p=window.videojs.getAllPlayers?window.videojs.getAllPlayers():Object.values(window.videojs.getPlayers());
-                        p.forEach(x=>{try{u.push(x.currentSrc())}catch(e){}});
-                    }}catch(e){}
-                    try{if(window.jwplayer){const p=window.jwplayer();
-                        if(p&&p.getPlaylistItem){const i=p.getPlaylistItem();
-                        if(i&&i.file)u.push(i.file);}
-                    }}catch(e){}
-                    return u.filter(x=>x&&typeof x==='string');
-                }""")
-                for src in (ps or []):
-                    if _is_hls(src):
-                        captured.append({"url":src,"status":200,"t":time.time()})
-                        log.info(f"  ✓ JS: {src[:160]}")
-            except: pass
-
-            # C: __NEXT_DATA__ (Tamasha is Next.js!)
-            try:
-                nd = page.evaluate("""()=>{
-                    const el=document.getElementById('__NEXT_DATA__');
-                    if(!el)return null;
-                    const d=JSON.parse(el.textContent);
-                    const s=JSON.stringify(d);
-                    const urls=[];
-                    const re=/https?:\/\/[^"'\\s]*\.m3u8[^"'\\s]*/gi;
-                    let m;while((m=re.exec(s))!==null)urls.push(m[0]);
-                    return urls;
-                }""")
-                for src in (nd or []):
-                    c = src.replace("\\u0026","&").replace("\\/","/")
-                    captured.append({"url":c,"status":200,"t":time.time()})
-                    log.info(f"  ✓ NEXT_DATA: {c[:160]}")
-            except: pass
-
-            # D: Regex page source
-            try:
-                html = page.content()
-                for m in re.findall(r'(https?://[^\s"\'<>\\]*\.m3u8[^\s"\'<>\\]*)', html, re.I):
-                    c=m.replace("\\u0026","&").replace("\\/","/").replace("\\u003d","=").replace("&amp;","&")
-                    captured.append({"url":c,"status":200,"t":time.time()})
-                    log.info(f"  ✓ Regex: {c[:160]}")
-            except: pass
-
-            # E: data attributes
-            try:
-                da = page.evaluate("""()=>{
-                    const u=[];
-                    document.querySelectorAll('[data-src],[data-url],[data-stream],[data-video-url],[data-hls],[data-manifest]').forEach(el=>{
-                        ['data-src','data-url','data-stream','data-video-url','data-hls','data-manifest'].forEach(a=>{
-                            const v=el.getAttribute(a);if(v)u.push(v);
-                        });
-                    });
-                    return u;
-                }""")
-                for src in (da or []):
-                    if _is_hls(src):
-                        captured.append({"url":src,"status":200,"t":time.time()})
-            except: pass
-
-            if not captured:
-                time.sleep(4)
+            # The first check can run before hydration; a login redirect or
+            # paywall may only have appeared since
+            with tr.span("premium_recheck"):
+                prem, reason = _page_prem(page)
+            if prem:
+                return {"success":False,"error":"Premium — login required.","reason":reason,
+                        "_stages":tr.stages,"_trace":tr.root}
+            with tr.span("deep", stage=False):
+                log.info("  Deep extraction...")
+
+                # A: video.src
+                with tr.span("deep_a"):
+                    try:
+                        srcs = page.evaluate("""()=>{
+                            const s=new Set();
+                            document.querySelectorAll('video').forEach(v=>{
+                                if(v.src)s.add(v.src);if(v.currentSrc)s.add(v.currentSrc);
+                                v.querySelectorAll('source').forEach(x=>{if(x.src)s.add(x.src)});
+                            });
+                            document.querySelectorAll('iframe').forEach(f=>{
+                                try{const d=f.contentDocument||f.contentWindow.document;
+                                d.querySelectorAll('video').forEach(v=>{if(v.src)s.add(v.src);if(v.currentSrc)s.add(v.currentSrc)});}catch(e){}
+                            });
+                            return[...s];
+                        }""")
+                        for src in (srcs or []):
+                            if src and _is_hls(src):
+                                captured.append({"url":src,"status":200,"t":time.time()})
+                                log.info(f"  ✓ src: {src[:160]}")
+                    except: pass
+
+                # B: Player JS objects
+                with tr.span("deep_b"):
+                    try:
+                        ps = page.evaluate("""()=>{
+                            const u=[];
+                            try{document.querySelectorAll('video').forEach(v=>{
+                                for(const k of Object.keys(v)){const o=v[k];
+                                if(o&&typeof o==='object'){
+                                    if(o.url&&typeof o.url==='string')u.push(o.url);
+                                    if(o.levels)o.levels.forEach(l=>{if(l.url)u.push(l.url);if(l.uri)u.push(l.uri)});
+                                }}});
+                            }catch(e){}
+                            try{if(window.videojs){
+                                const p=window.videojs.getAllPlayers?window.videojs.getAllPlayers():Object.values(window.videojs.getPlayers());
+                                p.forEach(x=>{try{u.push(x.currentSrc())}catch(e){}});
+                            }}catch(e){}
+                            try{if(window.jwplayer){const p=window.jwplayer();
+                                if(p&&p.getPlaylistItem){const i=p.getPlaylistItem();
+                                if(i&&i.file)u.push(i.file);}
+                            }}catch(e){}
+                            return u.filter(x=>x&&typeof x==='string');
+                        }""")
+                        for src in (ps or []):
+                            if _is_hls(src):
+                                captured.append({"url":src,"status":200,"t":time.time()})
+                                log.info(f"  ✓ JS: {src[:160]}")
+                    except: pass
+
+                # C: __NEXT_DATA__ (Tamasha is Next.js!)
+                with tr.span("deep_c"):
+                    try:
+                        nd = page.evaluate("""()=>{
+                            const el=document.getElementById('__NEXT_DATA__');
+                            if(!el)return null;
+                            const d=JSON.parse(el.textContent);
+                            const s=JSON.stringify(d);
+                            const urls=[];
+                            const re=/https?:\/\/[^"'\\s]*\.m3u8[^"'\\s]*/gi;
+                            let m;while((m=re.exec(s))!==null)urls.push(m[0]);
+                            return urls;
+                        }""")
+                        for src in (nd or []):
+                            c = src.replace("\\u0026","&").replace("\\/","/")
+                            captured.append({"url":c,"status":200,"t":time.time()})
+                            log.info(f"  ✓ NEXT_DATA: {c[:160]}")
+                    except: pass
+
+                # D: Regex page source
+                with tr.span("deep_d"):
+                    try:
+                        html = page.content()
+                        for c in _find_m3u8(html):
+                            captured.append({"url":c,"status":200,"t":time.time()})
+                            log.info(f"  ✓ Regex: {c[:160]}")
+                    except: pass
+
+                # E: data attributes
+                with tr.span("deep_e"):
+                    try:
+                        da = page.evaluate("""()=>{
+                            const u=[];
+                            document.querySelectorAll('[data-src],[data-url],[data-stream],[data-video-url],[data-hls],[data-manifest]').forEach(el=>{
+                                ['data-src','data-url','data-stream','data-video-url','data-hls','data-manifest'].forEach(a=>{
+                                    const v=el.getAttribute(a);if(v)u.push(v);
+                                });
+                            });
+                            return u;
+                        }""")
+                        for src in (da or []):
+                            if _is_hls(src):
+                                captured.append({"url":src,"status":200,"t":time.time()})
+                    except: pass
+
+                if not captured:
+                    with tr.span("deep_wait"): _wait_for_hls(page, captured, 4)
 
         log.info(f"  Captured: {len(captured)}")
+        if captured and TOKEN_REPLAY:
+            recipe = _learn_recipe(xhrs, _rank(captured)[0])
 
     except Exception as e:
         log.error(f"Extract error: {e}", exc_info=True)
-        return {"success":False,"error":str(e)[:300]}
+        return {"success":False,"error":str(e)[:300],"_stages":tr.stages,"_trace":tr.root}
     finally:
-        try:
-            if browser: browser.close()
-        except: pass
-        try:
-            if pw: pw.stop()
-        except: pass
+        with tr.span("teardown"):
+            try:
+                if ctx: ctx.close()
+            except: pass
+        tr.finish()  # results returned above hold tr.root, so they see this too
 
     if not captured:
         return {
@@ -598,59 +1552,986 @@ def do_extract(slug):
             "error":"No m3u8 captured.",
             "video_found":video_found,
             "failed_reqs":failed[:5],
+            "waits":waits,
             "hint":"Try /api/debug_channel for diagnostics.",
+            "_stages":tr.stages,"_trace":tr.root,
         }
 
-    # Dedup & score
-    seen=set(); uniq=[]
-    for e in captured:
-        k=e["url"].split("&nimblesessionid=")[0] if "&nimblesessionid=" in e["url"] else e["url"]
-        if k not in seen: seen.add(k); uniq.append(e)
-
-    best = max(uniq, key=lambda e:(_score(e["url"]),e["t"]))
-    url = best["url"]
-    sc = _score(url)
-    alts = [e["url"] for e in sorted(uniq,key=lambda e:_score(e["url"]),reverse=True)]
-    cset(slug, url, alts)
+    url, sc, alts, n = _rank(captured)
     log.info(f"  ★ Best (score={sc}): {url[:180]}")
 
     return {
-        "success":True,"stream_url":url,"channel":slug,
-        "captured":len(uniq),"score":sc,"video_found":video_found,
+        "success":True,"stream_url":url,"channel":slug,"source":"browser",
+        "captured":n,"score":sc,"video_found":video_found,
+        "hls_wait_s":hls_wait,"early_exit":early,"waits":waits,
         "alternatives":alts[1:4] if len(alts)>1 else [],
-        "note":"Fresh HLS link ~10-30min expiry. Play in VLC or hlsjs.video-dev.org/demo/",
+        "note":NOTE,"_alts":alts,"_recipe":recipe,"_stages":tr.stages,"_trace":tr.root,
+    }
+
+
+# ══════════════════════════════════════════════════════════════════
+# HTTP fast path — __NEXT_DATA__ without a browser
+# ══════════════════════════════════════════════════════════════════
+def _http_session():
+    s = requests.Session()
+    ad = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+    s.mount("https://", ad); s.mount("http://", ad)
+    s.headers.update({"User-Agent": UA[0], "Accept-Language": "en-US,en;q=0.9",
+                      "Accept": "text/html,application/json;q=0.9,*/*;q=0.8"})
+    return s
+
+_http = _http_session()
+_build = {"id": None, "ts": 0}
+NEXT_DATA_RE = re.compile(r'<script[^>]+id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S)
+
+def _build_id():
+    if _build["id"] and time.time() - _build["ts"] < BUILD_ID_TTL: return _build["id"]
+    return None
+
+def _next_page(slug):
+    """Fetch the channel page; returns (text to scan, final url). Caches buildId."""
+    r = _http.get(f"{TAMASHA}/{slug}", timeout=FAST_PATH_TIMEOUT)
+    m = NEXT_DATA_RE.search(r.text)
+    if m:
+        try:
+            bid = json.loads(m.group(1)).get("buildId")
+            if bid: _build.update(id=bid, ts=time.time())
+        except ValueError: pass
+    return (m.group(1) if m else r.text), r.url
+
+def _next_json(slug):
+    """Fetch /_next/data/{buildId}/{slug}.json; None when no buildId or it went stale."""
+    bid = _build_id()
+    if not bid: return None
+    r = _http.get(f"{TAMASHA}/_next/data/{bid}/{slug}.json", timeout=FAST_PATH_TIMEOUT)
+    if r.status_code == 404:  # redeployed — buildId rotated
+        _build["id"] = None
+        return None
+    return r.text if r.ok else None
+
+def _verify_m3u8(url):
+    try:
+        with _http.get(url, timeout=FAST_PATH_TIMEOUT, stream=True) as r:
+            return r.ok and b"#EXTM3U" in r.raw.read(1024, decode_content=True)
+    except requests.RequestException:
+        return False
+
+def fast_extract(slug):
+    """
+    Try to find a playable URL over plain HTTP. Returns an extraction result,
+    or None when nothing usable turned up and the browser has to run.
+    """
+    t0 = time.time()
+    try:
+        text, final = _next_json(slug), None
+        if not text or not _find_m3u8(text):
+            text, final = _next_page(slug)
+    except requests.RequestException as e:
+        log.info(f"  ⚡ fast path: {e.__class__.__name__}")
+        return None
+    if final:
+        prem, reason = _prem(final)
+        if prem:
+            return {"success":False,"error":"Premium — login required.","reason":reason,"source":"http"}
+    now = time.time()
+    found = [{"url":u,"status":200,"t":now} for u in _find_m3u8(text) if _is_hls(u)]
+    if not found:
+        log.info(f"  ⚡ fast path: nothing in __NEXT_DATA__ ({time.time()-t0:.2f}s)")
+        return None
+    url, sc, alts, n = _rank(found)
+    if FAST_PATH_VERIFY:
+        url = next((u for u in alts[:3] if _verify_m3u8(u)), None)
+        if not url:
+            log.info("  ⚡ fast path: candidates did not verify")
+            return None
+        alts = [url] + [u for u in alts if u != url]
+        sc = _score(url)
+    log.info(f"  ⚡ fast path hit (score={sc}) in {time.time()-t0:.2f}s: {url[:160]}")
+    return {
+        "success":True,"stream_url":url,"channel":slug,"source":"http",
+        "captured":n,"score":sc,"alternatives":alts[1:4],"note":NOTE,"_alts":alts,
     }
 
 
+# ══════════════════════════════════════════════════════════════════
+# Token replay — re-issue the XHR that handed the player its playlist
+# ══════════════════════════════════════════════════════════════════
+_recipes = {}
+_SKIP_HEADERS = {"host","content-length","connection","accept-encoding","transfer-encoding"}
+_TS_RE = re.compile(r'(?<![\d])(\d{13}|\d{10})(?![\d])')
+
+def _templatize(s):
+    """Swap current-time stamps (cache busters, signed-at) for {ts}/{ts_ms} placeholders."""
+    if not s: return s
+    now = time.time()
+    def sub(m):
+        v = int(m.group(1))
+        if len(m.group(1)) == 13 and abs(v/1000 - now) < 86400: return "{ts_ms}"
+        if len(m.group(1)) == 10 and abs(v - now) < 86400: return "{ts}"
+        return m.group(1)
+    return _TS_RE.sub(sub, s)
+
+def _render(s):
+    if not s: return s
+    now = time.time()
+    return s.replace("{ts_ms}", str(int(now*1000))).replace("{ts}", str(int(now)))
+
+def _learn_recipe(xhrs, url):
+    """
+    Find the fetch/XHR whose response body carried the winning playlist and
+    record how to repeat it: method, URL template, headers (cookies included)
+    and body. Must run before the context closes. Returns None if no match.
+    """
+    path = urlparse(url).path
+    for resp in xhrs:
+        try:
+            if not 200 <= resp.status < 300: continue
+            if path not in _unescape(resp.text()): continue
+            req = resp.request
+            hdrs = {k:v for k,v in req.all_headers().items()
+                    if not k.startswith(":") and k.lower() not in _SKIP_HEADERS}
+            log.info(f"  📼 Token call: {req.method} {req.url[:160]}")
+            return {"method":req.method, "url":_templatize(req.url), "headers":hdrs,
+                    "body":_templatize(req.post_data), "learned":time.time(), "hits":0, "fails":0}
+        except Exception: continue
+    return None
+
+def replay_extract(slug):
+    """Re-issue the learned token call for slug. Returns a result, or None to fall through."""
+    rec = _recipes.get(slug)
+    if not rec: return None
+    t0 = time.time()
+    found = []
+    try:
+        r = _http.request(rec["method"], _render(rec["url"]), headers=rec["headers"],
+                          data=_render(rec["body"]), timeout=FAST_PATH_TIMEOUT)
+        if r.ok:
+            found = [{"url":u,"status":200,"t":t0} for u in _find_m3u8(r.text) if _is_hls(u)]
+    except requests.RequestException as e:
+        log.info(f"  📼 replay: {e.__class__.__name__}")
+    url = None
+    if found:
+        url, sc, alts, n = _rank(found)
+        if FAST_PATH_VERIFY and not _verify_m3u8(url): url = None
+    if not url:
+        rec["fails"] += 1
+        if rec["fails"] >= REPLAY_MAX_FAILS:
+            _recipes.pop(slug, None)
+            log.info(f"  📼 replay: dropped recipe for {slug} after {rec['fails']} failures")
+        return None
+    rec["fails"] = 0
+    rec["hits"] += 1
+    log.info(f"  📼 replay hit (score={sc}) in {time.time()-t0:.2f}s: {url[:160]}")
+    return {
+        "success":True,"stream_url":url,"channel":slug,"source":"replay",
+        "captured":n,"score":sc,"alternatives":alts[1:4],"note":NOTE,"_alts":alts,
+    }
+
+
+# ══════════════════════════════════════════════════════════════════
+# Negative cache — per-channel circuit breaker for repeat failures
+# ══════════════════════════════════════════════════════════════════
+def _failure_class(r):
+    if r.get("failure_class") == "capacity": return "capacity"  # ours, not the channel's
+    err = (r.get("error") or "").lower()
+    if err.startswith("premium"): return "premium"
+    if err.startswith("no m3u8"): return "no_m3u8"
+    return "error"
+
+
+class _Breaker:
+    """
+    A failed extraction opens the channel's circuit for
+    BASE[class] * 2^(n-1) seconds (n = consecutive failures of that class,
+    capped at BREAKER_MAX_COOLDOWN). While open, requests are answered from
+    memory. After the cooldown a single caller is let through as a
+    half-open probe; success closes the circuit, failure re-opens it longer.
+    """
+    BASE = {"premium": 600, "no_m3u8": 60, "error": 30}
+    PROBE_TIMEOUT = EXTRACT_TIMEOUT + 30
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = {}
+        self.rejected = 0
+
+    def check(self, ch):
+        """None if ch may be extracted (possibly as the probe), else its open-circuit state."""
+        now = time.time()
+        with self.lock:
+            s = self.state.get(ch)
+            if not s: return None
+            if now < s["until"] or now - s["probe"] < self.PROBE_TIMEOUT:
+                self.rejected += 1
+                return dict(s)
+            s["probe"] = now
+            log.info(f"🔌 Half-open probe: {ch} ({s['cls']} x{s['n']})")
+            return None
+
+    def record(self, ch, r):
+        now = time.time()
+        with self.lock:
+            if r.get("success"):
+                if self.state.pop(ch, None): log.info(f"🔌 Circuit closed: {ch}")
+                return
+            cls = _failure_class(r)
+            prev = self.state.get(ch)
+            n = prev["n"] + 1 if prev and prev["cls"] == cls else 1
+            cooldown = min(BREAKER_MAX_COOLDOWN, self.BASE[cls] * 2 ** (n - 1))
+            self.state[ch] = {"cls": cls, "n": n, "until": now + cooldown, "probe": 0,
+                              "error": r.get("error"), "reason": r.get("reason")}
+        log.info(f"🔌 Circuit open: {ch} ({cls} x{n}) for {cooldown}s")
+
+    def abandon_probe(self, ch):
+        with self.lock:
+            s = self.state.get(ch)
+            if s: s["probe"] = 0
+
+    def reset(self, ch=None):
+        with self.lock:
+            if ch: self.state.pop(ch, None)
+            else: self.state.clear()
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            return {"rejected": self.rejected,
+                    "open": {ch: {"class": s["cls"], "failures": s["n"], "retry_in_s": max(0, int(s["until"] - now))}
+                             for ch, s in self.state.items()}}
+
+_breaker = _Breaker()
+
+
+# ══════════════════════════════════════════════════════════════════
+# Single-flight — one extraction per channel, however many callers
+# ══════════════════════════════════════════════════════════════════
+class _SingleFlight:
+    """
+    The first caller for a key runs fn; callers arriving while it is in
+    flight wait (up to timeout) on the same Future and get a copy of its
+    result. Returns (result, shared).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout):
+        with self.lock:
+            fut = self.calls.get(key)
+            leader = fut is None
+            if leader: fut = self.calls[key] = Future()
+            else: self.coalesced += 1
+        if not leader:
+            return dict(fut.result(timeout=timeout)), True
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self.lock: self.calls.pop(key, None)
+        return dict(fut.result()), False
+
+    def stats(self):
+        return {"in_flight": sorted(self.calls), "coalesced": self.coalesced}
+
+_flight = _SingleFlight()
+_bg = ThreadPoolExecutor(max_workers=max(1, BACKGROUND_CONCURRENCY), thread_name_prefix="revalidate")
+_bg_slots = threading.BoundedSemaphore(BACKGROUND_CONCURRENCY) if BACKGROUND_CONCURRENCY else threading.Semaphore(0)
+
+def _background_extract(ch):
+    """
+    Background (PRIO_BACKGROUND) extraction of ch through the single-flight,
+    holding one of the BACKGROUND_CONCURRENCY slots shared by refresh-ahead
+    and revalidation. None if every slot is taken.
+    """
+    if not _bg_slots.acquire(blocking=False): return None
+    try:
+        r, _ = _flight.do(ch, lambda: _extract_channel(ch, PRIO_BACKGROUND), COALESCE_WAIT)
+        return r
+    finally:
+        _bg_slots.release()
+
+_bg_pending = set()   # channels with a revalidation queued or running
+_bg_lock = threading.Lock()
+
+def _revalidate(ch):
+    """Fire-and-forget re-extraction of ch unless one is already queued or in flight."""
+    with _bg_lock:
+        if ch in _bg_pending or ch in _flight.calls: return
+        _bg_pending.add(ch)
+    def run():
+        try:
+            e=_cache.get(ch)  # not cget: a check, not a client hit
+            if e and datetime.utcnow() < e["exp"]: return  # refreshed while queued
+            _background_extract(ch)  # no free slot: the next stale hit asks again
+        except Exception as e: log.warning(f"Revalidate {ch} failed: {e}")
+        finally:
+            with _bg_lock: _bg_pending.discard(ch)
+    _bg.submit(run)
+
+
+def _await_peer(ch, t0):
+    """Another worker holds ch's lease: wait for its result to land in the shared cache."""
+    while time.time()-t0 < COALESCE_WAIT and _cache.holder(ch):
+        time.sleep(0.5)
+    c=cget(ch)
+    if c and _epoch(c["ts"]) >= t0-1:
+        return {"success":True,"stream_url":c["url"],"channel":ch,"source":"peer",
+                "alternatives":c["alts"][1:4],"extraction_time_seconds":round(time.time()-t0,2)}
+    return None
+
+def _extract_channel(ch, prio=PRIO_INTERACTIVE, job=None):
+    """
+    Cheapest path first: token replay, plain HTTP, then the browser pool at
+    the given queue priority. Caches successes; failures feed the circuit
+    breaker. An async job waits for queue space rather than failing and
+    gets its pool future attached for position reporting.
+    """
+    t0=time.time()
+    b=_breaker.check(ch)
+    if b:
+        r={"success":False,"error":b["error"],"reason":b.get("reason"),"channel":ch,
+           "source":"negative_cache","failure_class":b["cls"],
+           "retry_after_s":max(1,int(b["until"]-t0))}
+        _metrics.extraction(r, time.time()-t0)
+        return r
+    try:
+        r=_extract_uncached(ch, t0, prio, job)
+    except BaseException:
+        _breaker.abandon_probe(ch)
+        raise
+    # Only page-level outcomes open the circuit; our own queue/launch limits don't
+    if _failure_class(r)=="capacity": _breaker.abandon_probe(ch)
+    else: _breaker.record(ch, r)
+    _metrics.extraction(r, time.time()-t0)
+    _traces.record(r)
+    return r
+
+def _extract_uncached(ch, t0, prio, job):
+    tr=_Trace("fresh_stream", channel=ch, priority=prio)
+    lease_ttl=EXTRACT_TIMEOUT+30
+    with tr.span("lease", stage=False) as sp:
+        if not _cache.claim(ch, lease_ttl):
+            sp["held_by_peer"]=True
+            r=_await_peer(ch, t0)
+            if r:
+                r["_trace"]=tr.finish()
+                return r
+            _cache.claim(ch, lease_ttl)  # peer gave up or failed — our turn
+    try:
+        r=None
+        if TOKEN_REPLAY:
+            with tr.span("replay", stage=False) as sp:
+                r=replay_extract(CH[ch]); sp["hit"]=r is not None
+        if r is None and FAST_PATH:
+            with tr.span("fast_path", stage=False) as sp:
+                r=fast_extract(CH[ch]); sp["hit"]=r is not None
+        if r is None:
+            with tr.span("pool", stage=False) as sp:
+                try:
+                    fut=_pool.submit(do_extract, CH[ch], priority=prio, wait_s=EXTRACT_TIMEOUT if job else 0)
+                    if job: job["pool_fut"]=fut
+                    # Jobs may sit in the queue longer than EXTRACT_TIMEOUT by design;
+                    # once running, EXTRACT_DEADLINE bounds them
+                    r=_pool.wait(fut, None if job else EXTRACT_TIMEOUT)
+                except FutureTimeout:
+                    r={"success":False,"error":f"Extraction exceeded {EXTRACT_TIMEOUT}s.","failure_class":"capacity"}
+                except PoolSaturated:
+                    raise
+                except Exception as e:  # browser failed to launch/relaunch
+                    log.error(f"Extract error: {e}")
+                    r={"success":False,"error":str(e)[:300],"failure_class":"capacity"}
+                sub=r.pop("_trace",None)
+                if sub: tr.attach(sp, sub)  # its at_ms is the time spent queued
+        rec=r.pop("_recipe",None)
+        if rec: _recipes[CH[ch]]=rec
+        alts=r.pop("_alts",None)
+        if r.get("success"):
+            cset(ch, r["stream_url"], alts)
+            r["cache_ttl_s"]=int(_ttl_for(r["stream_url"]))
+    finally:
+        _cache.release(ch)  # after cset, so a waiting peer finds the entry
+    r["extraction_time_seconds"]=round(time.time()-t0,2)
+    r["channel"]=ch
+    r["_trace"]=tr.finish()
+    return r
+
+
+# ══════════════════════════════════════════════════════════════════
+# Refresh-ahead — re-extract popular channels before their token dies
+# ══════════════════════════════════════════════════════════════════
+class _Popularity:
+    """Per-channel request rate as an exponentially decayed counter."""
+    def __init__(self, half_life=POPULARITY_HALF_LIFE):
+        self.half_life = half_life
+        self.lock = threading.Lock()
+        self.scores = {}
+
+    def _decayed(self, ch, now):
+        s, t = self.scores.get(ch, (0.0, now))
+        return s * 0.5 ** ((now - t) / self.half_life)
+
+    def hit(self, ch):
+        now = time.time()
+        with self.lock: self.scores[ch] = (self._decayed(ch, now) + 1, now)
+
+    def get(self, ch):
+        return self._decayed(ch, time.time())
+
+_popularity = _Popularity()
+
+
+class _RefreshScheduler:
+    """
+    Every few seconds, picks cached channels whose entry expires within
+    REFRESH_AHEAD seconds, most popular then soonest-expiring first, and
+    re-extracts them through the single-flight so client misses join in.
+    Work is capped at REFRESH_BUDGET browser-seconds (time actually spent
+    in an extraction subprocess) per rolling minute, and shares the
+    BACKGROUND_CONCURRENCY slots with stale revalidation, so clients always
+    keep a browser.
+    """
+    TICK = 5
+    RETRY_AFTER = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.workers = BACKGROUND_CONCURRENCY
+        self.executor = None
+        self.running = set()
+        self.retry_at = {}
+        self.spent = deque()
+        self.refreshed = 0
+        self.failed = 0
+        self.budget_waits = 0
+
+    def start(self):
+        if REFRESH_AHEAD <= 0 or not self.workers: return
+        with self.lock:
+            if self.pid == os.getpid(): return
+            self.pid = os.getpid()
+            self.running, self.spent = set(), deque()
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="refresh")
+            threading.Thread(target=self._loop, name="refresh-ahead", daemon=True).start()
+
+    def browser_seconds(self):
+        cutoff = time.time() - 60
+        with self.lock:
+            while self.spent and self.spent[0][0] < cutoff: self.spent.popleft()
+            return sum(s for _, s in self.spent)
+
+    def due(self):
+        now = datetime.utcnow()
+        t = time.time()
+        out = []
+        for ch, e in centries():
+            left = (e["exp"] - now).total_seconds()
+            pop = _popularity.get(ch)
+            if (left <= REFRESH_AHEAD and pop >= REFRESH_MIN_POPULARITY and ch not in self.running
+                    and self.retry_at.get(ch, 0) <= t and ch not in _breaker.state):
+                out.append((-pop, left, ch))
+        return [ch for _, _, ch in sorted(out)]
+
+    def _loop(self):
+        while True:
+            time.sleep(self.TICK)
+            try:
+                for ch in self.due():
+                    if len(self.running) >= self.workers: break
+                    if self.browser_seconds() >= REFRESH_BUDGET:
+                        self.budget_waits += 1; break
+                    self.running.add(ch)
+                    self.executor.submit(self._refresh, ch)
+            except Exception as e:
+                log.error(f"Refresh scheduler error: {e}", exc_info=True)
+
+    def _refresh(self, ch):
+        try:
+            r = _background_extract(ch)
+            if r is None: return  # revalidation holds the slots; next tick
+            spent = _browser_seconds(r)
+            if spent:
+                with self.lock: self.spent.append((time.time(), spent))
+            if r.get("success"):
+                self.refreshed += 1
+                self.retry_at.pop(ch, None)
+                log.info(f"🔄 Refreshed ahead: {ch} via {r.get('source')}")
+            else:
+                self.failed += 1
+                self.retry_at[ch] = time.time() + self.RETRY_AFTER
+        except PoolSaturated:
+            pass
+        except Exception as e:
+            self.failed += 1
+            self.retry_at[ch] = time.time() + self.RETRY_AFTER
+            log.warning(f"Refresh-ahead {ch} failed: {e}")
+        finally:
+            self.running.discard(ch)
+
+    def stats(self):
+        return {
+            "enabled": REFRESH_AHEAD > 0 and self.workers > 0, "ahead_s": REFRESH_AHEAD,
+            "background_slots": BACKGROUND_CONCURRENCY,
+            "budget_s_per_min": REFRESH_BUDGET, "spent_s_last_min": round(self.browser_seconds(), 1),
+            "running": sorted(self.running), "refreshed": self.refreshed, "failed": self.failed,
+            "budget_waits": self.budget_waits,
+        }
+
+_scheduler = _RefreshScheduler()
+
+
+# ══════════════════════════════════════════════════════════════════
+# Batch — many channels, cache hits now, misses in parallel
+# ══════════════════════════════════════════════════════════════════
+_batch = ThreadPoolExecutor(max_workers=max(2, EXTRACT_CONCURRENCY*2), thread_name_prefix="batch")
+
+def _cached(ch):
+    """Response for a cache (or stale, which also triggers revalidation) hit; None on miss."""
+    c=cget(ch, stale_ok=True)
+    if not c: return None
+    now=datetime.utcnow()
+    left=int((c["exp"]-now).total_seconds())
+    r={"success":True,"stream_url":c["url"],"channel":ch,"source":"cache",
+       "age_s":int((now-c["ts"]).total_seconds()),"expires_in_s":left,
+       "alternatives":c.get("alts",[])[1:4]}
+    if left<0:
+        r.update(source="stale",stale_s=-left)
+        _revalidate(ch)
+    return r
+
+def _parse_channels(arg):
+    """'all' or a comma list → (known channels in request order, unknown names)."""
+    arg=(arg or "").strip().lower()
+    if arg=="all": return sorted(CH), []
+    names=list(dict.fromkeys(c.strip() for c in arg.split(",") if c.strip()))
+    return [c for c in names if c in CH], [c for c in names if c not in CH]
+
+def _extract_job(ch, force=False, since=0):
+    # Re-check the cache: by the time a queued batch task runs, an earlier
+    # task (or another request) may already have filled it. A forced task is
+    # satisfied by any entry extracted after its request started
+    if force:
+        e=_cache.get(ch)
+        r=_cached(ch) if e and _epoch(e["ts"]) >= since else None
+    else: r=_cached(ch)
+    if r: return r
+    try:
+        r,_=_flight.do(ch, lambda: _extract_channel(ch, PRIO_ASYNC), COALESCE_WAIT)
+        return r
+    except PoolSaturated:
+        return {"success":False,"error":"Extraction queue full.","channel":ch}
+    except FutureTimeout:
+        return {"success":False,"error":"Timed out waiting for in-flight extraction.","channel":ch}
+
+_batch_lock = threading.Lock()
+_batch_pending = 0
+
+def _batch_done(_):
+    global _batch_pending
+    with _batch_lock: _batch_pending -= 1
+
+def _batch_submit(ch, force, since):
+    """Queue _extract_job on _batch, or None once BATCH_MAX_PENDING tasks are outstanding."""
+    global _batch_pending
+    with _batch_lock:
+        if _batch_pending >= BATCH_MAX_PENDING: return None
+        _batch_pending += 1
+    fut=_batch.submit(_extract_job, ch, force, since)
+    fut.add_done_callback(_batch_done)  # also runs when cancelled
+    return fut
+
+def _batch_results(chans, unknown, deadline, force=False):
+    """
+    Yield one result per channel as soon as it is known: unknown names and
+    cache hits first, then extractions in completion order, then whatever
+    missed the deadline as "pending" (those keep running and fill the cache).
+    Past BATCH_MAX_PENDING outstanding tasks a channel is "rejected"; tasks
+    not yet started when a streaming client disconnects are dropped.
+    """
+    since=time.time()
+    futs={}
+    try:
+        for ch in unknown:
+            yield {"success":False,"channel":ch,"status":"unknown","error":f"Unknown: '{ch}'"}
+        for ch in chans:
+            _popularity.hit(ch)
+            r=None if force else _cached(ch)
+            if r: yield dict(r, status="cached"); continue
+            f=_batch_submit(ch, force, since)
+            if f: futs[f]=ch
+            else: yield {"success":False,"channel":ch,"status":"rejected",
+                         "error":f"{BATCH_MAX_PENDING} batch extractions already pending; retry later."}
+        left=set(futs)
+        try:
+            for f in as_completed(futs, timeout=deadline):
+                left.discard(f)
+                r=f.result()
+                yield dict(r, status=_batch_status(r))
+        except FutureTimeout:
+            pass
+        for f in left:
+            yield {"success":False,"channel":futs[f],"status":"pending",
+                   "error":f"Not done within {deadline}s deadline; still extracting in background."}
+    except GeneratorExit:  # streaming client went away: drop what hasn't started
+        for f in futs: f.cancel()
+        raise
+
+def _batch_status(r):
+    if r.get("source") in ("cache","stale"): return "cached"
+    if r.get("success"): return "ok"
+    return "rejected" if r.get("source")=="negative_cache" else "failed"
+
+
+# ══════════════════════════════════════════════════════════════════
+# M3U playlist — pre-rendered from the cache, rebuilt only on change
+# ══════════════════════════════════════════════════════════════════
+def _categories():
+    cats={"news":[],"entertainment":[],"religious":[],"regional":[],"other":[]}
+    for s in sorted(CH):
+        sl=s.lower()
+        if any(k in sl for k in ["news","city-42"]): cats["news"].append(s)
+        elif any(k in sl for k in ["entertainment","digital","tv-one","urdu","play-tv","see-tv","hum-tv","a-plus","zindagi","kahani","musik"]): cats["entertainment"].append(s)
+        elif any(k in sl for k in ["madani","qtv","paigham"]): cats["religious"].append(s)
+        elif any(k in sl for k in ["khyber","avt","sindh","ktn","waseb","mehran"]): cats["regional"].append(s)
+        else: cats["other"].append(s)
+    return cats
+
+def _display_name(ch):
+    words=[w for w in ch.split("-") if w not in ("live","hd")]
+    return " ".join(w.upper() if len(w)<=3 and not w.isdigit() else w.capitalize() for w in words)
+
+
+class _Playlist:
+    """
+    /playlist.m3u bytes (plain and gzip) plus their ETag. The cache is
+    re-read at most every CHECK_EVERY seconds, and the playlist is only
+    re-rendered when the set of servable (channel, url) pairs changed.
+    """
+    CHECK_EVERY = 2
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.key = None
+        self.out = (b"#EXTM3U\n", gzip.compress(b"#EXTM3U\n", mtime=0),
+                    hashlib.sha1(b"#EXTM3U\n").hexdigest()[:16])
+        self.renders = 0
+
+    def current(self):
+        now = time.time()
+        if now - self.checked < self.CHECK_EVERY: return self.out
+        with self.lock:
+            if now - self.checked < self.CHECK_EVERY: return self.out
+            self.checked = now
+            live = {ch: e["url"] for ch, e in centries() if _epoch(e["exp"]) + STALE_MAX > now}
+            key = tuple(sorted(live.items()))
+            if key != self.key:
+                self.key, self.out = key, self._render(live)
+                self.renders += 1
+            return self.out
+
+    @staticmethod
+    def _render(live):
+        lines = ["#EXTM3U"]
+        for cat, chans in _categories().items():
+            for ch in chans:
+                if ch not in live: continue
+                lines.append(f'#EXTINF:-1 tvg-id="{ch}" tvg-name="{_display_name(ch)}" '
+                             f'group-title="{cat.capitalize()}",{_display_name(ch)}')
+                lines.append(live[ch])
+        body = ("\n".join(lines) + "\n").encode()
+        return body, gzip.compress(body, mtime=0), hashlib.sha1(body).hexdigest()[:16]
+
+_playlist = _Playlist()
+
+
+# ══════════════════════════════════════════════════════════════════
+# Async jobs — 202 Accepted now, poll /api/jobs/<id> for the result
+# ══════════════════════════════════════════════════════════════════
+class JobsFull(Exception):
+    """Raised when JOB_MAX_PENDING async jobs are already queued or running."""
+
+
+class _Jobs:
+    """
+    Async extractions. Each job runs the normal pipeline on its own thread
+    at PRIO_ASYNC, so its browser work queues behind interactive requests,
+    and waits for queue space instead of being rejected. Job state is
+    mirrored to the shared cache DB so any worker can answer a poll; live
+    queue position and ETA come from the worker that owns the job.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.live = {}
+        self.executor = ThreadPoolExecutor(max_workers=JOB_MAX_PENDING, thread_name_prefix="job")
+
+    def create(self, ch):
+        now = time.time()
+        with self.lock:
+            for jid in [j for j, v in self.live.items() if v["finished"] and now - v["finished"] > JOB_RETENTION]:
+                del self.live[jid]
+            if sum(1 for v in self.live.values() if not v["finished"]) >= JOB_MAX_PENDING:
+                raise JobsFull(f"{JOB_MAX_PENDING} jobs already pending")
+            job = {"id": f"{os.getpid():x}-{uuid4().hex[:12]}", "channel": ch, "created": now,
+                   "started": None, "finished": None, "result": None, "pool_fut": None}
+            self.live[job["id"]] = job
+        self._mirror(job)
+        self.executor.submit(self._run, job)
+        return self.view(job)
+
+    def _run(self, job):
+        job["started"] = time.time()
+        try:
+            r, shared = _flight.do(job["channel"], lambda: _extract_channel(job["channel"], PRIO_ASYNC, job),
+                                   None)
+            if shared: r["coalesced"] = True
+        except PoolSaturated:
+            r = {"success": False, "error": "Extraction queue stayed full.", "channel": job["channel"]}
+        except FutureTimeout:
+            r = {"success": False, "error": "Timed out waiting for in-flight extraction.", "channel": job["channel"]}
+        except Exception as e:
+            log.error(f"Job {job['id']} failed: {e}", exc_info=True)
+            r = {"success": False, "error": str(e)[:300], "channel": job["channel"]}
+        job["result"], job["finished"] = r, time.time()
+        self._mirror(job)
+
+    def _mirror(self, job):
+        try: _cache.job_put(self.view(job))
+        except sqlite3.Error as e: log.warning(f"Job mirror failed: {e}")
+
+    @staticmethod
+    def view(job):
+        now = time.time()
+        v = {"id": job["id"], "channel": job["channel"],
+             "created": _dt(job["created"]).isoformat() + "Z"}
+        fut = job["pool_fut"]
+        if job["finished"]:
+            v.update(state="done", elapsed_s=round(job["finished"] - job["created"], 2), result=job["result"])
+            return v
+        ahead = _pool.position(fut) if fut else None
+        if not job["started"] or ahead is not None:
+            v.update(state="queued", position=ahead,
+                     eta_s=_pool.eta(ahead if ahead is not None else _pool.jobs.qsize()))
+        else:
+            v.update(state="running")
+        v["elapsed_s"] = round(now - job["created"], 2)
+        return v
+
+    def get(self, jid):
+        job = self.live.get(jid)
+        return self.view(job) if job else _cache.job_get(jid)
+
+    def stats(self):
+        with self.lock:
+            pending = sum(1 for v in self.live.values() if not v["finished"])
+        return {"pending": pending, "max_pending": JOB_MAX_PENDING, "retained": len(self.live)}
+
+_jobs = _Jobs()
+
+
+# ══════════════════════════════════════════════════════════════════
+# Traces — span trees of recent extractions, for slow-channel triage
+# ══════════════════════════════════════════════════════════════════
+class _Traces:
+    """
+    Rolling buffer of the last TRACE_BUFFER traces in this process.
+    record() moves a result's "_trace" here and leaves a trace_id behind,
+    which ?trace=1 resolves back to the tree.
+    """
+    def __init__(self, size=TRACE_BUFFER):
+        self.lock = threading.Lock()
+        self.buf = deque(maxlen=max(1, size))
+
+    def record(self, r):
+        tree = r.pop("_trace", None)
+        if not tree: return None
+        t = {"id": uuid4().hex[:12], "ts": datetime.utcnow().isoformat() + "Z",
+             "channel": r.get("channel") or tree.get("slug"), "ms": tree["ms"],
+             "success": r.get("success"), "source": r.get("source"), "trace": tree}
+        with self.lock: self.buf.append(t)
+        r["trace_id"] = t["id"]
+        return t
+
+    def get(self, tid):
+        with self.lock: return next((t for t in self.buf if t["id"] == tid), None)
+
+    def list(self, channel=None, slowest=False, limit=20):
+        with self.lock: ts = [t for t in self.buf if not channel or t["channel"] == channel]
+        ts = sorted(ts, key=lambda t: t["ms"], reverse=True) if slowest else ts[::-1]
+        return ts[:limit]
+
+_traces = _Traces()
+
+def _browser_seconds(r):
+    """
+    Seconds r's extraction spent inside a pool subprocess (browser launch
+    included), read from its recorded trace; 0 for replay, fast-path,
+    peer and cache results, and for time spent queued or leased.
+    """
+    t = _traces.get(r.get("trace_id")) if r.get("trace_id") else None
+    if not t: return 0.0
+    pools = [n for n in t["trace"].get("children") or [] if n["name"] == "pool"]
+    return sum((c.get("ms") or 0) + c.get("launch_ms", 0) for p in pools for c in p.get("children") or []) / 1000
+
+
+# ══════════════════════════════════════════════════════════════════
+# Metrics — Prometheus text exposition, no client library
+# ══════════════════════════════════════════════════════════════════
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 90)
+
+def _fmt_labels(labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+class _Metrics:
+    """
+    Process-local counters and histograms. Every series carries a worker
+    (pid) label, because under gunicorn each scrape lands on one worker.
+    Cache, pool, breaker and job figures are read from their stats() at
+    scrape time instead of being mirrored here.
+    """
+    HELP = {
+        "tamasha_stage_seconds": ("histogram", "Seconds spent in each do_extract stage."),
+        "tamasha_extraction_seconds": ("histogram", "End-to-end extraction time by source."),
+        "tamasha_extractions_total": ("counter", "Extractions by source and outcome (success or failure class)."),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.hists = {}     # (name, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock: self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, v, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            h = self.hists.setdefault(key, [0] * (len(STAGE_BUCKETS) + 2))
+            for i, b in enumerate(STAGE_BUCKETS):
+                if v <= b: h[i] += 1
+            h[-2] += v; h[-1] += 1
+
+    def extraction(self, r, dt):
+        """Record one _extract_channel result, including its per-stage timings."""
+        src = r.get("source") or "browser"
+        self.observe("tamasha_extraction_seconds", dt, source=src)
+        self.inc("tamasha_extractions_total", source=src,
+                 outcome="success" if r.get("success") else r.get("failure_class") or _failure_class(r))
+        for stage, sec in (r.pop("_stages", None) or {}).items():
+            self.observe("tamasha_stage_seconds", sec, stage=stage)
+
+    def render(self):
+        w = (("worker", os.getpid()),)
+        out = []
+        def head(name, kind, text):
+            out.append(f"# HELP {name} {text}"); out.append(f"# TYPE {name} {kind}")
+        def put(name, v, labels=()):
+            out.append(f"{name}{_fmt_labels(w + tuple(labels))} {v}")
+
+        with self.lock:
+            counters, hists = dict(self.counters), {k: list(v) for k, v in self.hists.items()}
+        for name, (kind, text) in self.HELP.items():
+            head(name, kind, text)
+            if kind == "counter":
+                for (n, labels), v in sorted(counters.items()):
+                    if n == name: put(name, v, labels)
+                continue
+            for (n, labels), h in sorted(hists.items()):
+                if n != name: continue
+                for b, c in zip(STAGE_BUCKETS, h):
+                    put(name + "_bucket", c, labels + (("le", b),))
+                put(name + "_bucket", h[-1], labels + (("le", "+Inf"),))
+                put(name + "_sum", round(h[-2], 3), labels)
+                put(name + "_count", h[-1], labels)
+
+        c = _cache.stats()
+        head("tamasha_cache_lookups_total", "counter", "Cache lookups by result.")
+        for k in ("hits", "stale_hits", "misses"):
+            put("tamasha_cache_lookups_total", c[k], (("result", k),))
+        head("tamasha_cache_evictions_total", "counter", "Entries evicted by the LRU bounds.")
+        put("tamasha_cache_evictions_total", c["evictions"])
+        head("tamasha_cache_entries", "gauge", "Entries in the shared cache.")
+        put("tamasha_cache_entries", c["entries"])
+        head("tamasha_cache_bytes", "gauge", "Bytes held by the shared cache.")
+        put("tamasha_cache_bytes", c["bytes"])
+
+        p = _pool.stats()
+        for name, v, text in (("tamasha_pool_size", p["size"], "Extraction subprocesses (one browser each)."),
+                              ("tamasha_pool_active", p["active"], "Extractions running now."),
+                              ("tamasha_pool_queued", p["queued"], "Extractions waiting for a browser."),
+                              ("tamasha_pool_queue_depth", p["queue_depth"], "Queue capacity before 503/202.")):
+            head(name, "gauge", text); put(name, v)
+        head("tamasha_pool_rejected_total", "counter", "Submissions refused with the queue full.")
+        put("tamasha_pool_rejected_total", p["rejected"])
+        head("tamasha_worker_rss_mb", "gauge", "RSS of each extraction subprocess tree.")
+        for x in p["workers"]:
+            put("tamasha_worker_rss_mb", x["tree_rss_mb"], (("slot", x["worker"]),))
+        head("tamasha_worker_kills_total", "counter", "Extraction subprocesses killed at the hard deadline.")
+        for x in p["workers"]:
+            put("tamasha_worker_kills_total", x["kills"], (("slot", x["worker"]),))
+
+        head("tamasha_breaker_open", "gauge", "Channels held open by the circuit breaker.")
+        put("tamasha_breaker_open", len(_breaker.stats()["open"]))
+        head("tamasha_jobs_pending", "gauge", "Async jobs not finished yet.")
+        put("tamasha_jobs_pending", _jobs.stats()["pending"])
+        head("tamasha_single_flight_in_flight", "gauge", "Channels with an extraction in flight.")
+        put("tamasha_single_flight_in_flight", len(_flight.calls))
+        return "\n".join(out) + "\n"
+
+_metrics = _Metrics()
+
+
 # ══════════════════════════════════════════════════════════════════
 # Routes
 # ══════════════════════════════════════════════════════════════════
 @app.route("/")
 def index():
     return jsonify({
-        "service":"Tamasha Free HLS Extractor","v":"2.4.0","status":"running",
+        "service":"Tamasha Free HLS Extractor","v":"2.5.0","status":"running",
         "endpoints":{
             "/":"Docs", "/api/health":"Health", "/api/channels":"Channels",
             "/api/fresh_stream?channel=SLUG":"Extract", "/api/debug_channel?channel=SLUG":"Debug",
+            "/api/streams?channels=a,b,c|all":"Batch extract",
+            "/api/streams?channels=...&format=ndjson|sse":"Batch extract, streamed per channel",
+            "/playlist.m3u":"M3U of cached channels (ETag, gzip)",
+            "/api/fresh_stream?channel=SLUG&async=1":"Extract as a job (202)", "/api/jobs/ID":"Job status",
+            "/metrics":"Prometheus metrics",
+            "/api/fresh_stream?channel=SLUG&trace=1":"Extract with its span tree",
+            "/api/traces?channel=SLUG&sort=slow":"Recent extraction traces", "/api/traces/ID":"One trace",
         },
     })
 
 @app.route("/api/health")
 def health():
-    return jsonify({"status":"healthy","v":"2.4.0","ts":datetime.utcnow().isoformat()+"Z",
-                    "cache":len(_cache),"channels":len(CH),"busy":_busy})
+    return jsonify({"status":"healthy","v":"2.5.0","ts":datetime.utcnow().isoformat()+"Z",
+                    "cache":len(_cache),"cache_db":CACHE_DB,"cache_stats":_cache.stats(),"channels":len(CH),
+                    "snapshot":{"path":CACHE_SNAPSHOT or None,**{k:v for k,v in _snap.items() if k!="pid"}},
+                    "browser_pool":_pool.stats(),"single_flight":_flight.stats(),
+                    "token_recipes":len(_recipes),"refresh_ahead":_scheduler.stats(),
+                    "circuit_breaker":_breaker.stats(),"jobs":_jobs.stats()})
+
+@app.route("/metrics")
+def metrics():
+    return Response(_metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/api/channels")
 def channels():
-    cats={"news":[],"entertainment":[],"religious":[],"regional":[],"other":[]}
-    for s in sorted(CH):
-        sl=s.lower()
-        if any(k in sl for k in ["news","city-42"]): cats["news"].append(s)
-        elif any(k in sl for k in ["entertainment","digital","tv-one","urdu","play-tv","see-tv","hum-tv","a-plus","zindagi","kahani","musik"]): cats["entertainment"].append(s)
-        elif any(k in sl for k in ["madani","qtv","paigham"]): cats["religious"].append(s)
-        elif any(k in sl for k in ["khyber","avt","sindh","ktn","waseb","mehran"]): cats["regional"].append(s)
-        else: cats["other"].append(s)
-    return jsonify({"total":len(CH),"by_category":cats,"all":sorted(CH)})
+    return jsonify({"total":len(CH),"by_category":_categories(),"all":sorted(CH)})
+
+@app.route("/playlist.m3u")
+def playlist():
+    body,gz,etag=_playlist.current()
+    use_gz="gzip" in request.headers.get("Accept-Encoding","")
+    tag=f'"{etag}-gz"' if use_gz else f'"{etag}"'
+    hdrs={"ETag":tag,"Vary":"Accept-Encoding","Cache-Control":f"public, max-age={_Playlist.CHECK_EVERY}"}
+    # Exact per-tag match (weak comparison, as RFC 9110 says for If-None-Match)
+    if request.if_none_match.contains_weak(tag.strip('"')):
+        return Response(status=304, headers=hdrs)
+    if use_gz: hdrs["Content-Encoding"]="gzip"
+    return Response(gz if use_gz else body, mimetype="audio/x-mpegurl", headers=hdrs)
 
 @app.route("/api/fresh_stream")
 def fresh_stream():
@@ -663,29 +2544,87 @@ def fresh_stream():
         sug=sorted(set(s for s in CH if ch in s or s in ch or any(p in s for p in parts)))[:8]
         return jsonify({"success":False,"error":f"Unknown: '{ch}'","suggestions":sug}),404
 
-    slug=CH[ch]
-
+    _popularity.hit(ch)
     if not force:
-        c=cget(ch)
-        if c:
-            age=int((datetime.utcnow()-c["ts"]).total_seconds())
-            return jsonify({"success":True,"stream_url":c["url"],"channel":ch,"source":"cache",
-                           "age_s":age,"alternatives":c.get("alts",[])[1:4]})
+        r=_cached(ch)
+        if r: return jsonify(r)
 
-    if _is_busy():
-        return jsonify({"success":False,"error":"Server busy — extraction in progress. Retry in 30s.",
-                        "channel":ch,"hint":"Only one extraction at a time."}),503
+    if request.args.get("async","0")=="1":
+        return _accept_job(ch)
+    try:
+        r,shared=_flight.do(ch, lambda: _extract_channel(ch), COALESCE_WAIT)
+    except PoolSaturated:
+        return _accept_job(ch)  # queue full — hand back a job instead of a bare 503
+    except FutureTimeout:
+        return jsonify({"success":False,"error":f"Timed out after {COALESCE_WAIT}s waiting for in-flight extraction.",
+                        "channel":ch}),504
+    if shared: r["coalesced"]=True
+    if request.args.get("trace","0")=="1":
+        t=_traces.get(r.get("trace_id"))
+        r["trace"]=t["trace"] if t else None
+    if r.get("source")=="negative_cache":
+        return jsonify(r), 502, {"Retry-After":str(r["retry_after_s"])}
+    return jsonify(r), 200 if r.get("success") else 502
 
-    _set_busy(True)
-    t0=time.time()
+def _accept_job(ch):
     try:
-        r=do_extract(slug)
-    finally:
-        _set_busy(False)
+        job=_jobs.create(ch)
+    except JobsFull:
+        return jsonify({"success":False,"error":"Server at capacity — job queue full. Retry in 30s.",
+                        "channel":ch,"pool":_pool.stats(),"jobs":_jobs.stats()}),503
+    url=f"/api/jobs/{job['id']}"
+    return jsonify(dict(job, poll=url)), 202, {"Location":url, "Retry-After":"2"}
+
+@app.route("/api/jobs/<jid>")
+def job_ep(jid):
+    job=_jobs.get(jid)
+    if not job: return jsonify({"error":f"Unknown or expired job '{jid}'"}),404
+    return jsonify(job)
+
+@app.route("/api/streams")
+def streams():
+    """
+    Batch lookup. Default: one JSON document once every channel is done or
+    the deadline passes. format=ndjson / format=sse (or Accept:
+    text/event-stream) streams each channel as soon as it is ready.
+    """
+    chans,unknown=_parse_channels(request.args.get("channels"))
+    if not chans and not unknown:
+        return jsonify({"success":False,"error":"Missing 'channels' (comma list or 'all')."}),400
+    try: deadline=min(BATCH_DEADLINE, max(1, int(request.args.get("deadline", BATCH_DEADLINE))))
+    except ValueError: deadline=BATCH_DEADLINE
+    force=request.args.get("force","0")=="1"
+    fmt=request.args.get("format","").lower()
+    if not fmt and "text/event-stream" in request.headers.get("Accept",""): fmt="sse"
+    t0=time.time()
+    results=_batch_results(chans, unknown, deadline, force)
 
-    r["extraction_time_seconds"]=round(time.time()-t0,2)
-    r["channel"]=ch
-    return jsonify(r), 200 if r.get("success") else 502
+    def summary(rs):
+        return {"done":True,"requested":len(rs),"ok":sum(1 for r in rs if r.get("success")),
+                "cached":sum(1 for r in rs if r["status"]=="cached"),
+                "elapsed_s":round(time.time()-t0,2),"deadline_s":deadline}
+
+    if fmt in ("ndjson","sse"):
+        def gen():
+            seen=[]
+            try:
+                for r in results:
+                    seen.append(r)
+                    line=json.dumps(r, separators=(",",":"))
+                    yield f"event: channel\ndata: {line}\n\n" if fmt=="sse" else line+"\n"
+            finally:
+                results.close()
+            line=json.dumps(summary(seen), separators=(",",":"))
+            yield f"event: done\ndata: {line}\n\n" if fmt=="sse" else line+"\n"
+        mime="text/event-stream" if fmt=="sse" else "application/x-ndjson"
+        return Response(stream_with_context(gen()), mimetype=mime,
+                        headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
+
+    res={r["channel"]:r for r in results}
+    ordered=[res[ch] for ch in chans+unknown]
+    out=summary(ordered); del out["done"]
+    out["channels"]={r["channel"]:r for r in ordered}
+    return jsonify(out)
 
 @app.route("/api/debug_channel")
 def debug_ep():
@@ -694,37 +2633,53 @@ def debug_ep():
         return jsonify({"error":"Need ?channel=slug"}),400
     slug=CH.get(ch,ch)
 
-    if _is_busy():
-        return jsonify({"error":"Server busy — retry in 30s."}),503
-
-    _set_busy(True)
     t0=time.time()
     try:
-        r=do_debug(slug)
-    finally:
-        _set_busy(False)
+        r=_pool.run(do_debug, slug)
+    except PoolSaturated:
+        return jsonify({"error":"Server at capacity — retry in 30s."}),503
+    except FutureTimeout:
+        r={"error":f"Debug exceeded {EXTRACT_TIMEOUT}s."}
+    except Exception as e:
+        r={"error":str(e)[:300]}
 
     r["debug_time_seconds"]=round(time.time()-t0,2)
+    t=_traces.record(r)
+    if t and request.args.get("trace","0")=="1": r["trace"]=t["trace"]
     return jsonify(r)
 
+@app.route("/api/traces")
+@app.route("/api/traces/<tid>")
+def traces_ep(tid=None):
+    if tid:
+        t=_traces.get(tid)
+        return (jsonify(t),200) if t else (jsonify({"error":f"Unknown or expired trace '{tid}'"}),404)
+    try: limit=max(1,int(request.args.get("limit","20")))
+    except ValueError: limit=20
+    ch=request.args.get("channel","").strip().lower() or None
+    return jsonify({"buffer":TRACE_BUFFER,
+                    "traces":_traces.list(ch, request.args.get("sort")=="slow", limit)})
+
 @app.route("/api/cache",methods=["DELETE"])
 def cache_ep():
     ch=request.args.get("channel","").strip().lower()
-    if ch: _cache.pop(ch,None); return jsonify({"msg":f"Cleared '{ch}'"})
-    n=len(_cache); _cache.clear(); return jsonify({"msg":f"Cleared {n}"})
-
-@app.route("/api/reset_busy",methods=["POST","GET"])
-def reset_busy():
-    """Emergency endpoint to reset stuck busy flag."""
-    _set_busy(False)
-    return jsonify({"msg":"Busy flag reset.","busy":_busy})
+    _breaker.reset(ch or None)
+    if ch: _cache.delete(ch); return jsonify({"msg":f"Cleared '{ch}'"})
+    n=_cache.clear(); return jsonify({"msg":f"Cleared {n}"})
 
 @app.errorhandler(404)
 def e404(e): return jsonify({"error":"Not found"}),404
 @app.errorhandler(500)
 def e500(e): return jsonify({"error":"Server error"}),500
 
+if not _IN_WORKER:  # extraction subprocesses import this module too
+    _cache.start_sweeper()
+    start_snapshots()
+    if BROWSER_PREWARM:
+        _pool.start()
+    _scheduler.start()
+
 if __name__=="__main__":
     port=int(os.environ.get("PORT",5000))
-    log.info(f"v2.4 :{port} | {len(CH)} ch")
+    log.info(f"v2.5 :{port} | {len(CH)} ch | {EXTRACT_CONCURRENCY} browsers")
     app.run(host="0.0.0.0",port=port)
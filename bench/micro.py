@@ -0,0 +1,210 @@
+"""
+Micro-benchmarks for the per-request hot paths in app.py — _is_hls and
+_score (every response), _blocked (every routed request), _prem (every
+landing page + body text) and _rank (the capture dedup) — over seeded
+synthetic corpora of CDN, playlist, segment, analytics and asset URLs.
+
+  python bench/micro.py                      # report ns/call
+  python bench/micro.py --save main          # write bench/baselines/micro-main.json
+  python bench/micro.py --compare main       # exit 1 if any path got --threshold slower
+
+Baselines are per machine: costs are compared in plain ns/call. For a
+rough cross-machine comparison --normalize divides by a fixed pure-Python
+calibration loop instead. Verdict checksums are compared too: a faster
+classifier that answers differently fails as well.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINES = os.path.join(HERE, "baselines")
+
+CDN_HOSTS = ["live-cdn{}.tamashaweb.com", "nimble{}.jazz.net.pk", "edge{}.akamaized.net",
+             "vod{}.cloudfront.net", "stream{}.wowza.tamasha.pk", "cdn{}.jwplayer.com"]
+ANALYTICS = ["https://www.google-analytics.com/g/collect?v=2&tid=G-{a}&cid={n}.{m}&en=page_view&dl={dl}",
+             "https://www.googletagmanager.com/gtag/js?id=G-{a}&l=dataLayer&cx=c",
+             "https://connect.facebook.net/signals/config/{n}?v=2.9.1&r=stable",
+             "https://www.facebook.com/tr/?id={n}&ev=PageView&dl={dl}&rl=&if=false&ts={m}",
+             "https://securepubads.g.doubleclick.net/gampad/ads?iu=/{n}/tamasha&sz=728x90&correlator={m}",
+             "https://pagead2.googlesyndication.com/pagead/js/adsbygoogle.js?client=ca-pub-{n}",
+             "https://script.hotjar.com/modules.{a}.js", "https://o{n}.ingest.sentry.io/api/{m}/envelope/",
+             "https://www.clarity.ms/collect?id={a}&n={n}", "https://metrics.tamashaweb.com/v1/events?sid={a}&seq={n}"]
+ASSETS = [("image", "https://img.tamashaweb.com/channels/{slug}/poster-{a}.webp?w=640"),
+          ("image", "https://cdn.tamashaweb.com/_next/image?url=%2Flogos%2F{slug}.png&w=128&q=75"),
+          ("font", "https://cdn.tamashaweb.com/_next/static/media/{a}.woff2"),
+          ("stylesheet", "https://cdn.tamashaweb.com/_next/static/css/{a}.css"),
+          ("script", "https://cdn.tamashaweb.com/_next/static/chunks/pages/{slug}-{a}.js"),
+          ("media", "https://ads.tamashaweb.com/preroll/{a}.mp4"),
+          ("fetch", "https://api.tamashaweb.com/v2/channels/{slug}?lang=en&platform=web&t={m}"),
+          ("xhr", "https://api.tamashaweb.com/v2/epg/{slug}?date=2024-05-{d:02d}")]
+BODY_WORDS = ("live news drama sports cricket match highlights watch now schedule channel "
+              "pakistan urdu english episode tonight prime time breaking update anchor show").split()
+PREM_PHRASES = ["Please login to continue", "Subscribe to watch this channel", "Enter your OTP",
+                "Get Tamasha Pro for ad-free viewing", "Jazz/Warid users only"]
+
+
+def _sign(r):
+    raw = f"server_time=5/{r.randint(1, 28)}/2024 {r.randint(1, 12)}:{r.randint(10, 59)}:00 PM" \
+          f"&hash_value={r.getrandbits(96):024x}&validminutes={r.choice([10, 20, 30])}"
+    return base64.b64encode(raw.encode()).decode().replace("=", "%3D")
+
+
+def corpora(n, seed=1):
+    """Deterministic (rt, url) requests, captured-entry lists and (page_url, body) pairs."""
+    r = random.Random(seed)
+    slugs = [f"channel-{i}-live" for i in range(60)]
+    def fill(t):
+        return t.format(a=f"{r.getrandbits(40):010x}", n=r.randint(10**6, 10**9), m=r.randint(10**9, 2 * 10**9),
+                        slug=r.choice(slugs), d=r.randint(1, 28), dl="https%3A%2F%2Ftamashaweb.com%2F" + r.choice(slugs))
+    def playlist():
+        host = r.choice(CDN_HOSTS).format(r.randint(1, 9))
+        path = f"https://{host}/live/{r.choice(slugs)}/"
+        kind = r.random()
+        if kind < .35: path += r.choice(["playlist.m3u8", "chunklist_b1500000.m3u8", "index.m3u8", "master.m3u8"])
+        elif kind < .75: path += f"media_{r.randint(1000, 99999)}.ts"
+        else: path += f"{r.choice(['720p', '480p', '360p'])}/stream.m3u8"
+        q = r.random()
+        if q < .5: path += f"?wmsAuthSign={_sign(r)}&nimblesessionid={r.randint(10**6, 10**8)}"
+        elif q < .75: path += f"?token={r.getrandbits(128):032x}&expires={r.randint(1.7e9, 1.8e9)}"
+        return path
+
+    reqs = []
+    for _ in range(n):
+        x = r.random()
+        if x < .3: reqs.append(("fetch" if r.random() < .5 else "media", playlist()))
+        elif x < .6: reqs.append((r.choice(["script", "xhr", "image", "ping"]), fill(r.choice(ANALYTICS))))
+        else:
+            rt, t = r.choice(ASSETS)
+            reqs.append((rt, fill(t)))
+
+    captures = []
+    for _ in range(max(1, n // 50)):
+        base = [playlist() for _ in range(r.randint(2, 8))]
+        caps = []
+        for _ in range(r.randint(10, 60)):
+            u = r.choice(base)
+            if "nimblesessionid=" in u: u = u.rsplit("=", 1)[0] + f"={r.randint(10**6, 10**8)}"
+            caps.append({"url": u, "status": 200, "t": 1.7e9 + r.random()})
+        captures.append(caps)
+
+    pages = []
+    for _ in range(max(1, n // 20)):
+        words = [r.choice(BODY_WORDS) for _ in range(r.randint(200, 600))]
+        if r.random() < .15: words.insert(r.randrange(len(words)), r.choice(PREM_PHRASES))
+        url = f"https://tamashaweb.com/{r.choice(slugs)}" if r.random() < .9 else \
+              f"https://tamashaweb.com/{r.choice(['login', 'plans', 'subscribe'])}?next=%2F{r.choice(slugs)}"
+        pages.append((url, " ".join(words)[:3000]))
+    return reqs, captures, pages
+
+
+def _time(fn, items, min_s):
+    """Best-of-7 ns per item, looping the corpus until one pass takes >= min_s."""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops): fn(items)
+        dt = time.perf_counter() - t0
+        if dt >= min_s: break
+        loops *= 2
+    best = dt
+    for _ in range(6):
+        t0 = time.perf_counter()
+        for _ in range(loops): fn(items)
+        best = min(best, time.perf_counter() - t0)
+    return round(best / (loops * len(items)) * 1e9, 1)
+
+
+def run(n, seed, min_s):
+    os.environ.update({"BROWSER_PREWARM": "0", "CACHE_SNAPSHOT": "", "REFRESH_AHEAD_SECONDS": "0",
+                       "CACHE_DB": os.path.join(tempfile.mkdtemp(prefix="tamasha-micro-"), "cache.db")})
+    sys.path.insert(0, ROOT)
+    import app
+
+    reqs, captures, pages = corpora(n, seed)
+    urls = [u for _, u in reqs]
+    benches = {
+        "_is_hls": (lambda xs: [app._is_hls(u) for u in xs], urls),
+        "_score": (lambda xs: [app._score(u) for u in xs], urls),
+        "_blocked": (lambda xs: [app._blocked(rt, u) for rt, u in xs], reqs),
+        "_prem": (lambda xs: [app._prem(u, b) for u, b in xs], pages),
+        "_prem_url": (lambda xs: [app._prem(u) for u in xs], urls),
+        "_rank": (lambda xs: [app._rank(c) for c in xs], captures),
+    }
+    # Fixed interpreter workload, to compare baselines across machines; timed
+    # before and after the suite, best kept, so one noisy pass doesn't skew every ratio
+    def calibrate(xs): return [len(u.lower().split("?")[0]) for u in xs]
+    calib = _time(calibrate, urls, min_s)
+
+    results = {}
+    for name, (fn, items) in benches.items():
+        ns = _time(fn, items, min_s)
+        verdicts = json.dumps(fn(items), sort_keys=True, default=str).encode()
+        results[name] = {"ns_per_call": ns, "calls": len(items),
+                         "verdicts": hashlib.sha1(verdicts).hexdigest()[:12]}
+    calib = min(calib, _time(calibrate, urls, min_s))
+    for v in results.values(): v["norm"] = round(v["ns_per_call"] / calib, 3)
+    return {
+        "meta": {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "host": platform.node(), "corpus": n, "seed": seed, "calibration_ns": calib},
+        "results": results,
+    }
+
+
+def compare(cur, base, threshold, normalize=False):
+    key = "norm" if normalize else "ns_per_call"
+    bad = []
+    print(f"\n{'function':<12}{'baseline':>10}{'current':>10}{'delta':>9}  ({key})")
+    for name, c in cur["results"].items():
+        b = base["results"].get(name)
+        if not b: continue
+        d = (c[key] - b[key]) / b[key] if b[key] else 0.0
+        flag = ""
+        if d > threshold: bad.append(f"{name} +{d:.0%}"); flag = "  ✗ slower"
+        if c["verdicts"] != b["verdicts"] and cur["meta"]["seed"] == base["meta"]["seed"] \
+                and cur["meta"]["corpus"] == base["meta"]["corpus"]:
+            bad.append(f"{name} verdicts changed"); flag += "  ✗ verdicts"
+        print(f"{name:<12}{b[key]:>10}{c[key]:>10}{d:>+8.0%}{flag}")
+    return bad
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks for app.py URL classification.")
+    ap.add_argument("-n", "--corpus", type=int, default=5000, help="synthetic requests to generate")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per timed pass")
+    ap.add_argument("--save", metavar="NAME", help="write bench/baselines/micro-NAME.json")
+    ap.add_argument("--compare", metavar="NAME", help="compare with bench/baselines/micro-NAME.json")
+    ap.add_argument("--threshold", type=float, default=0.25, help="relative slowdown counted as a regression")
+    ap.add_argument("--normalize", action="store_true", help="compare calibration-normalised cost instead of ns")
+    a = ap.parse_args()
+
+    res = run(a.corpus, a.seed, a.min_time)
+    print(f"corpus {a.corpus} (seed {a.seed}) | calibration {res['meta']['calibration_ns']} ns")
+    for name, v in res["results"].items():
+        print(f"  {name:<12}{v['ns_per_call']:>10} ns/call  x{v['norm']:<7} {v['calls']} calls  {v['verdicts']}")
+
+    if a.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"micro-{a.save}.json")
+        with open(path, "w") as f: json.dump(res, f, indent=2)
+        print(f"Saved baseline {path}")
+    if a.compare:
+        with open(os.path.join(BASELINES, f"micro-{a.compare}.json")) as f: base = json.load(f)
+        bad = compare(res, base, a.threshold, a.normalize)
+        if bad:
+            print(f"\nRegressions: {', '.join(bad)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
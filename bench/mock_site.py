@@ -0,0 +1,179 @@
+"""
+Local stand-in for TAMASHA_BASE_URL — a Next.js-shaped site whose pages
+exercise each extraction path, so benchmarks are reproducible offline.
+
+The channel slug picks the behavior:
+  xhr-<name>       player fetches a signed playlist URL by XHR after --xhr-delay-ms
+  nextdata-<name>  playlist URL only in __NEXT_DATA__ (no request, deep extraction)
+  iframe-<name>    the xhr player inside an <iframe>
+  premium-<name>   302 to /login ("Please login to watch")
+Slugs without a known prefix behave like xhr. Every page also fires
+--noise-per-sec first-party analytics beacons and loads third-party tags
+on BLOCKED domains, like the real site.
+
+Usage: python bench/mock_site.py --port 8765 [--xhr-delay-ms 1500] [--noise-per-sec 5]
+"""
+
+import json
+import time
+import base64
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, quote
+
+BUILD_ID = "bench-build"
+KINDS = ("xhr", "nextdata", "iframe", "premium")
+
+
+def _kind(slug):
+    k = slug.split("-", 1)[0]
+    return k if k in KINDS else "xhr"
+
+
+def _signed(base, slug, minutes=20):
+    """Nimble-style wmsAuthSign playlist URL, so token-expiry parsing sees a real-looking TTL."""
+    now = datetime.now(timezone.utc).strftime("%m/%d/%Y %I:%M:%S %p")
+    sign = base64.b64encode(f"server_time={now}&hash_value=bench&validminutes={minutes}".encode()).decode()
+    return f"{base}/live/{slug}/playlist.m3u8?wmsAuthSign={quote(sign)}&nimblesessionid={int(time.time())}"
+
+
+NOISE_JS = """
+<script async src="https://www.googletagmanager.com/gtag/js?id=G-BENCH"></script>
+<script async src="https://connect.facebook.net/en_US/fbevents.js"></script>
+<script>
+  (function(){var n=0;setInterval(function(){
+    navigator.sendBeacon ? navigator.sendBeacon('/analytics/collect?n='+(n++), '{}')
+                         : fetch('/analytics/collect?n='+(n++), {method:'POST', body:'{}'});
+  }, %(interval)d);})();
+</script>
+"""
+
+PLAYER_JS = """
+<video id="player" class="video-js" muted playsinline></video>
+<script>
+  setTimeout(function(){
+    fetch('/api/v1/channels/%(slug)s/stream').then(function(r){return r.json()}).then(function(d){
+      document.getElementById('player').src = d.url;
+      return fetch(d.url);
+    }).catch(function(){});
+  }, %(delay)d);
+</script>
+"""
+
+
+class MockSite(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    xhr_delay_ms = 1500
+    noise_per_sec = 5
+    counts = {}
+    lock = threading.Lock()
+
+    def log_message(self, *a):
+        pass
+
+    def _send(self, code, body=b"", ctype="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str): body = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD": self.wfile.write(body)
+
+    def _count(self, what):
+        with self.lock: self.counts[what] = self.counts.get(what, 0) + 1
+
+    @property
+    def base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def _page(self, slug, body, props):
+        data = {"props": {"pageProps": props}, "page": "/[channel]", "query": {"channel": slug},
+                "buildId": BUILD_ID, "isFallback": False}
+        noise = NOISE_JS % {"interval": max(50, int(1000 / self.noise_per_sec))} if self.noise_per_sec > 0 else ""
+        return (f"<!DOCTYPE html><html><head><title>{slug} | Tamasha</title></head><body>"
+                f"<div id=\"__next\">{body}</div>"
+                f"<script id=\"__NEXT_DATA__\" type=\"application/json\">{json.dumps(data)}</script>"
+                f"{noise}</body></html>")
+
+    def _channel(self, slug):
+        kind = _kind(slug)
+        self._count(kind)
+        if kind == "premium":
+            return self._send(302, headers={"Location": "/login"})
+        props = {"channel": {"slug": slug, "name": slug.replace("-", " ").title()}}
+        if kind == "nextdata":
+            props["channel"]["stream_url"] = _signed(self.base, slug)
+            body = '<video id="player" class="video-js" muted playsinline></video>'
+        elif kind == "iframe":
+            body = f'<iframe src="/embed/{slug}" width="960" height="540" allow="autoplay"></iframe>'
+        else:
+            body = PLAYER_JS % {"slug": slug, "delay": self.xhr_delay_ms}
+        self._send(200, self._page(slug, body, props))
+
+    def do_GET(self):
+        path = urlparse(self.path).path.strip("/")
+        parts = path.split("/")
+        if path == "":
+            return self._send(200, self._page("home", "<h1>Tamasha</h1>", {}))
+        if path == "login":
+            self._count("login")
+            return self._send(200, "<html><body><h2>Please login to watch</h2>"
+                                   "<form><input name=msisdn placeholder='Enter mobile'></form></body></html>")
+        if parts[0] == "embed" and len(parts) == 2:
+            return self._send(200, "<html><body>" + PLAYER_JS % {"slug": parts[1], "delay": self.xhr_delay_ms}
+                              + "</body></html>")
+        if parts[:3] == ["api", "v1", "channels"] and len(parts) == 5 and parts[4] == "stream":
+            self._count("stream_xhr")
+            return self._send(200, json.dumps({"url": _signed(self.base, parts[3])}), "application/json")
+        if parts[0] == "live" and path.endswith(".m3u8"):
+            self._count("playlist")
+            return self._send(200, "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n"
+                                   "#EXT-X-MEDIA-SEQUENCE:1\n#EXTINF:6.0,\nseg1.ts\n",
+                              "application/vnd.apple.mpegurl")
+        if parts[:2] == ["_next", "data"] and len(parts) == 4 and parts[3].endswith(".json"):
+            slug = parts[3][:-5]
+            if parts[2] != BUILD_ID: return self._send(404, "{}", "application/json")
+            props = {"channel": {"slug": slug}}
+            if _kind(slug) == "nextdata": props["channel"]["stream_url"] = _signed(self.base, slug)
+            return self._send(200, json.dumps({"pageProps": props}), "application/json")
+        if len(parts) == 1 or parts[0] in ("watch", "live"):
+            return self._channel(parts[-1])
+        self._send(404, "<h1>404</h1>")
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        if n: self.rfile.read(n)
+        if urlparse(self.path).path == "/analytics/collect":
+            self._count("beacon")
+            return self._send(204)
+        self._send(404)
+
+    do_HEAD = do_GET
+
+
+def serve(port=0, xhr_delay_ms=1500, noise_per_sec=5):
+    """Start the mock on a daemon thread; returns (server, base_url)."""
+    MockSite.xhr_delay_ms = xhr_delay_ms
+    MockSite.noise_per_sec = noise_per_sec
+    srv = ThreadingHTTPServer(("127.0.0.1", port), MockSite)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="mock-site", daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local mock of the Tamasha site for benchmarks.")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--xhr-delay-ms", type=int, default=1500)
+    ap.add_argument("--noise-per-sec", type=float, default=5)
+    a = ap.parse_args()
+    srv, base = serve(a.port, a.xhr_delay_ms, a.noise_per_sec)
+    print(f"Mock Tamasha at {base}  (slugs: {', '.join(k + '-<name>' for k in KINDS)})", flush=True)
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,234 @@
+"""
+Offline extraction benchmark — drives do_extract through the real browser
+pool against bench/mock_site.py (or any --base-url) and reports latency
+p50/p95, throughput, CPU seconds and peak RSS of the extraction process
+trees, overall and per scenario, plus median seconds per stage.
+
+  python bench/run.py                              # 20 extractions, 2 browsers, all scenarios
+  python bench/run.py -n 40 -c 4 --scenarios xhr,iframe
+  python bench/run.py --save v2.5                  # write bench/baselines/v2.5.json
+  python bench/run.py --compare v2.5               # diff against it; exit 1 past --threshold
+
+App settings not covered by a flag (EXTRA_WAIT_SECONDS, HLS_GRACE_SECONDS,
+CDP_BLOCKING, ...) are read from the environment as usual, so they can be A/B'd too.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINES = os.path.join(HERE, "baselines")
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# Lower is better for these; throughput and success rate are higher-is-better
+LOWER_IS_BETTER = ("p50_s", "p95_s", "mean_s", "cpu_s_per_extract", "peak_rss_mb")
+
+
+def _pct(xs, p):
+    if not xs: return None
+    xs = sorted(xs)
+    k = (len(xs) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(xs) - 1)
+    return round(xs[lo] + (xs[hi] - xs[lo]) * (k - lo), 3)
+
+
+def _cpu_ticks(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f: st = f.read().rsplit(")", 1)[1].split()
+        return int(st[11]) + int(st[12])  # utime + stime
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Sampler:
+    """
+    Polls the extraction subprocess trees: peak summed RSS, and CPU as the
+    last-seen utime+stime of every pid (so browsers recycled mid-run still
+    count, up to the final sample before they exit).
+    """
+    def __init__(self, app, every=0.25):
+        self.app, self.every = app, every
+        self.cpu = {}
+        self.base = {}
+        self.peak_rss = 0.0
+        self.stop_ev = threading.Event()
+
+    def _pids(self):
+        roots = [w.proc.pid for w in self.app._pool.slots if w.alive()]
+        ppids = self.app._ppids()
+        return roots + [d for r in roots for d in self.app._descendants(r, ppids)]
+
+    def sample(self):
+        pids = self._pids()
+        self.peak_rss = max(self.peak_rss, self.app._rss_mb(pids))
+        for p in pids:
+            t = _cpu_ticks(p)
+            if t is not None: self.cpu[p] = t
+
+    def start(self):
+        self.sample()
+        self.base = dict(self.cpu)
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while not self.stop_ev.wait(self.every): self.sample()
+
+    def stop(self):
+        self.stop_ev.set(); self.sample()
+        return round(sum(t - self.base.get(p, 0) for p, t in self.cpu.items()) / CLK_TCK, 2)
+
+
+def _summary(rows, wall_s=None):
+    lat = [r["s"] for r in rows]
+    ok = [r for r in rows if r["success"]]
+    out = {"n": len(rows), "success_rate": round(len(ok) / len(rows), 3) if rows else None,
+           "p50_s": _pct(lat, .5), "p95_s": _pct(lat, .95),
+           "mean_s": round(sum(lat) / len(lat), 3) if lat else None}
+    if wall_s: out["throughput_per_min"] = round(len(rows) / wall_s * 60, 2)
+    return out
+
+
+def run(a):
+    from mock_site import serve, KINDS
+    srv = None
+    base = a.base_url
+    if not base:
+        srv, base = serve(0, a.xhr_delay_ms, a.noise_per_sec)
+    os.environ.update({
+        "TAMASHA_BASE_URL": base,
+        "EXTRACT_CONCURRENCY": str(a.concurrency),
+        "EXTRACT_QUEUE_DEPTH": str(max(16, a.requests)),
+        "BROWSER_PREWARM": "1",
+        "CACHE_DB": os.path.join(tempfile.mkdtemp(prefix="tamasha-bench-"), "cache.db"),
+        "CACHE_SNAPSHOT": "",
+        "REFRESH_AHEAD_SECONDS": "0",
+    })
+    sys.path.insert(0, ROOT)
+    import app
+
+    scen = [s for s in a.scenarios.split(",") if s]
+    bad = [s for s in scen if s not in KINDS]
+    if bad: sys.exit(f"Unknown scenario(s) {bad}; choose from {list(KINDS)}")
+    slugs = [f"{scen[i % len(scen)]}-bench-{i}" for i in range(a.requests)]
+
+    # Warm-up: one job per browser so launch cost stays out of the numbers
+    print(f"Mock at {base} | {a.concurrency} browser(s) | warming up...", flush=True)
+    with ThreadPoolExecutor(a.concurrency) as ex:
+        list(ex.map(lambda i: app._pool.run(app.do_extract, f"xhr-warmup-{i}"), range(a.concurrency)))
+
+    rows, lock = [], threading.Lock()
+    def one(slug):
+        t0 = time.time()
+        try: r = app._pool.run(app.do_extract, slug)
+        except Exception as e: r = {"success": False, "error": str(e)[:200]}
+        row = {"scenario": slug.split("-", 1)[0], "s": time.time() - t0,
+               "success": bool(r.get("success")) or (slug.startswith("premium") and "Premium" in (r.get("error") or "")),
+               "stages": r.get("_stages") or {}}
+        with lock: rows.append(row)
+        print(f"  {slug:<24} {row['s']:6.2f}s {'ok' if row['success'] else 'FAIL ' + str(r.get('error'))[:60]}", flush=True)
+
+    sampler = _Sampler(app)
+    sampler.start()
+    t0 = time.time()
+    with ThreadPoolExecutor(a.concurrency) as ex:
+        list(ex.map(one, slugs))
+    wall = time.time() - t0
+    cpu = sampler.stop()
+
+    stages = {}
+    for r in rows:
+        for k, v in r["stages"].items(): stages.setdefault(k, []).append(v)
+    result = {
+        "meta": {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": _git_rev(), "python": platform.python_version(),
+                 "host": platform.node(), "cpus": os.cpu_count(), "base_url": base if a.base_url else "mock"},
+        "config": {"requests": a.requests, "concurrency": a.concurrency, "scenarios": scen,
+                   "xhr_delay_ms": a.xhr_delay_ms, "noise_per_sec": a.noise_per_sec,
+                   "extra_wait_s": app.EXTRA_WAIT, "hls_grace_s": app.HLS_GRACE,
+                   "cdp_blocking": app.CDP_BLOCKING},
+        "overall": dict(_summary(rows, wall), wall_s=round(wall, 2), cpu_s=cpu,
+                        cpu_s_per_extract=round(cpu / len(rows), 3) if rows else None,
+                        peak_rss_mb=sampler.peak_rss),
+        "scenarios": {s: _summary([r for r in rows if r["scenario"] == s]) for s in scen},
+        "stages_p50_s": {k: _pct(v, .5) for k, v in sorted(stages.items())},
+    }
+    if srv: srv.shutdown()
+    app._pool.shutdown()
+    return result
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(cur, base, threshold):
+    """Print metric deltas vs a baseline; returns the regressions beyond threshold."""
+    regressions = []
+    rows = [("overall", k) for k in cur["overall"]] + \
+           [(s, k) for s in cur["scenarios"] for k in cur["scenarios"][s] if s in base["scenarios"]]
+    print(f"\n{'':<10}{'metric':<20}{'baseline':>10}{'current':>10}{'delta':>9}")
+    for sect, k in rows:
+        b = (base["overall"] if sect == "overall" else base["scenarios"][sect]).get(k)
+        c = (cur["overall"] if sect == "overall" else cur["scenarios"][sect]).get(k)
+        if not isinstance(b, (int, float)) or not isinstance(c, (int, float)) or k in ("n", "wall_s", "cpu_s"):
+            continue
+        d = (c - b) / b if b else 0.0
+        worse = d > threshold if k in LOWER_IS_BETTER else d < -threshold
+        if worse: regressions.append(f"{sect}.{k}")
+        print(f"{sect:<10}{k:<20}{b:>10}{c:>10}{d:>+8.0%}{'  ✗' if worse else ''}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do_extract against a local mock Tamasha site.")
+    ap.add_argument("-n", "--requests", type=int, default=20)
+    ap.add_argument("-c", "--concurrency", type=int, default=2, help="browsers in the pool and client threads")
+    ap.add_argument("--scenarios", default="xhr,nextdata,iframe,premium")
+    ap.add_argument("--xhr-delay-ms", type=int, default=1500)
+    ap.add_argument("--noise-per-sec", type=float, default=5)
+    ap.add_argument("--base-url", help="benchmark against this site instead of the built-in mock")
+    ap.add_argument("--save", metavar="NAME", help="write the result to bench/baselines/NAME.json")
+    ap.add_argument("--compare", metavar="NAME", help="compare with bench/baselines/NAME.json")
+    ap.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    ap.add_argument("--json", action="store_true", help="print the full result as JSON")
+    a = ap.parse_args()
+
+    res = run(a)
+    if a.json: print(json.dumps(res, indent=2))
+    else:
+        o = res["overall"]
+        print(f"\n{o['n']} extractions in {o['wall_s']}s | p50 {o['p50_s']}s p95 {o['p95_s']}s | "
+              f"{o['throughput_per_min']}/min | ok {o['success_rate']:.0%} | "
+              f"cpu {o['cpu_s']}s ({o['cpu_s_per_extract']}s each) | peak rss {o['peak_rss_mb']}MB")
+        for s, v in res["scenarios"].items():
+            print(f"  {s:<9} n={v['n']:<3} p50 {v['p50_s']}s p95 {v['p95_s']}s ok {v['success_rate']:.0%}")
+        print("  stage p50: " + ", ".join(f"{k} {v}s" for k, v in res["stages_p50_s"].items()))
+
+    if a.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"{a.save}.json")
+        with open(path, "w") as f: json.dump(res, f, indent=2)
+        print(f"Saved baseline {path}")
+    if a.compare:
+        with open(os.path.join(BASELINES, f"{a.compare}.json")) as f: base = json.load(f)
+        if base.get("config", {}).get("concurrency") != a.concurrency:
+            print("Note: baseline ran at a different concurrency; throughput is not comparable.")
+        bad = compare(res, base, a.threshold)
+        if bad:
+            print(f"\nRegressed beyond {a.threshold:.0%}: {', '.join(bad)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+_ttl_for on Nimble wmsAuthSign URLs whose server_time is skewed by a
+whole-hour timezone offset (or not at all) and whose tokens are of
+various ages. Run with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import base64
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+os.environ.update({"BROWSER_PREWARM": "0", "CACHE_SNAPSHOT": "", "REFRESH_AHEAD_SECONDS": "0",
+                   "CACHE_DB": os.path.join(tempfile.mkdtemp(prefix="tamasha-test-"), "cache.db")})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+NOW = 1_715_000_000.0
+MARGIN = app.EXPIRY_MARGIN
+
+
+def signed(age_s, valid_min, offset_h=0, quoted=True):
+    """Playlist URL issued age_s ago, server_time written offset_h hours off UTC."""
+    t = datetime.utcfromtimestamp(NOW - age_s) + timedelta(hours=offset_h)
+    raw = f"server_time={t:%m/%d/%Y %I:%M:%S %p}&hash_value=a>b?~&validminutes={valid_min}"
+    sign = base64.b64encode(raw.encode()).decode()
+    return "https://nimble1.example.net/live/ch/playlist.m3u8?wmsAuthSign=" + (quote(sign) if quoted else sign)
+
+
+def left(age_s, valid_min):
+    """What _ttl_for should return: the token's real remaining life minus the margin."""
+    return max(0, min(app.CACHE_MAX_TTL, valid_min * 60 - age_s - MARGIN))
+
+
+class TokenExpiryTest(unittest.TestCase):
+    def check(self, age_s, valid_min, offset_h):
+        ttl = app._ttl_for(signed(age_s, valid_min, offset_h), NOW)
+        self.assertAlmostEqual(ttl, left(age_s, valid_min), delta=1,
+                               msg=f"age {age_s}s, {valid_min}min token, server_time UTC{offset_h:+d}")
+
+    def test_fresh_tokens(self):
+        for off in (0, 5, -5, 3, 9, -8):
+            self.check(0, 20, off)
+
+    def test_old_but_live_tokens_keep_their_age(self):
+        self.check(17 * 60, 20, 5)    # PKT: 3 minutes left, not 19
+        self.check(16 * 60, 20, -5)   # still live, must be cached
+        self.check(70 * 60, 120, 0)   # plain UTC, 50 minutes left — not an hour of skew
+        self.check(90 * 60, 120, 5)
+
+    def test_expired_tokens_are_not_cached(self):
+        for age, off in ((25 * 60, 5), (40 * 60, 5), (40 * 60, -5), (30 * 60, 0), (21 * 60, -3)):
+            self.assertEqual(app._ttl_for(signed(age, 20, off), NOW), 0, f"age {age}s UTC{off:+d}")
+
+    def test_small_clock_drift(self):
+        self.check(-120, 20, 0)
+        self.check(-120, 20, 5)
+
+    def test_raw_plus_in_sign(self):
+        url = next(u for u in (signed(a, 20, 0, quoted=False) for a in range(60)) if "+" in u)
+        self.assertGreater(app._ttl_for(url, NOW), 0)
+        self.assertNotEqual(app._ttl_for(url, NOW), app.CACHE_TTL)
+
+
+if __name__ == "__main__":
+    unittest.main()